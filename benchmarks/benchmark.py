@@ -0,0 +1,182 @@
+# ---------------- Benchmarks ---------------- #
+'''Mede o tempo e a memória de cada etapa do motor com painéis de preços sintéticos (sem acesso à internet).
+
+Uso:
+    python benchmarks/benchmark.py --saida resultados.json [--rapido] [--repeticoes 5]
+    python benchmarks/benchmark.py --comparar base.json novo.json
+
+Cada dimensão (número de ativos, número de carteiras, anos de histórico e periodicidade) é variada
+separadamente em torno de uma configuração base. O resultado é uma lista JSON com uma linha por
+etapa e configuração, identificada pelo commit do git, para comparar execuções entre commits.
+'''
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from markowitz.cache_precos import CachePrecos  # noqa: E402
+from markowitz.covariancia import estimar_covariancia  # noqa: E402
+from markowitz.download import DownloaderConcorrente  # noqa: E402
+from markowitz.fronteira import fronteira_eficiente  # noqa: E402
+from markowitz.motor import FATORES_PERIODICIDADE, baixar_precos, estatisticas_retornos  # noqa: E402
+from markowitz.otimizacao import carteiras_exatas  # noqa: E402
+from markowitz.simulacao import simular_carteiras  # noqa: E402
+
+
+CONFIGURACAO_BASE = {'n_ativos': 20, 'numero_portfolios': 100_000, 'anos': 5, 'peridiocidade': 'Diário'}
+VARIACOES = {'n_ativos': [2, 10, 50, 100, 250, 500],
+             'numero_portfolios': [1_000, 10_000, 100_000, 1_000_000, 10_000_000],
+             'anos': [1, 5, 10],
+             'peridiocidade': ['Diário', 'Mensal', 'Anual']}
+VARIACOES_RAPIDO = {'n_ativos': [2, 20, 100],
+                    'numero_portfolios': [1_000, 100_000],
+                    'anos': [5],
+                    'peridiocidade': ['Diário', 'Mensal', 'Anual']}
+DATA_INICIAL = pd.Timestamp('2013-01-16')
+
+
+class FonteSintetica:
+    '''Substitui o Yahoo Finance (mesma interface de 'baixar_lote_yahoo'): gera um passeio aleatório geométrico
+    reprodutível por ticker.'''
+
+    def __init__(self, semente=0):
+        self.semente = semente
+
+    def __call__(self, tickers, inicio, fim, timeout=None):
+        datas = pd.bdate_range(inicio, fim, inclusive='left')
+        colunas = {}
+        for ticker in tickers:
+            gerador = np.random.default_rng([self.semente, zlib.crc32(ticker.encode())])
+            colunas[ticker] = 30 * np.exp(np.cumsum(gerador.normal(0.0004, 0.02, len(datas))))
+        return pd.DataFrame(colunas, index=datas)
+
+
+def medir(funcao, repeticoes):
+    '''Executa 'funcao' várias vezes e retorna as latências (s), o pico de memória (bytes) e o último resultado.
+    O pico de memória vem de uma execução à parte, pois o tracemalloc deixa o código Python mais lento.'''
+    latencias = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        latencias.append(time.perf_counter() - inicio)
+    tracemalloc.start()
+    funcao()
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return np.array(latencias), pico, resultado
+
+
+def resumo(etapa, configuracao, latencias, pico, unidades):
+    return {'etapa': etapa, **configuracao,
+            'p50_s': float(np.percentile(latencias, 50)),
+            'p90_s': float(np.percentile(latencias, 90)),
+            'p99_s': float(np.percentile(latencias, 99)),
+            'vazao_por_s': float(unidades / np.median(latencias)),
+            'pico_memoria_mb': pico / 2 ** 20}
+
+
+def executar_configuracao(configuracao, repeticoes):
+    tickers = [f'T{i:04d}.SA' for i in range(configuracao['n_ativos'])]
+    data_f = DATA_INICIAL + pd.DateOffset(years=configuracao['anos'])
+    peridiocidade = configuracao['peridiocidade']
+    fator = FATORES_PERIODICIDADE[peridiocidade]
+    downloader = DownloaderConcorrente(FonteSintetica())
+
+    def pipeline(): # cache vazio a cada execução: download em lote, gravação em parquet, leitura e painel
+        with tempfile.TemporaryDirectory() as diretorio:
+            cache = CachePrecos(diretorio, offline=False, downloader=downloader)
+            return estatisticas_retornos(baixar_precos(tickers, DATA_INICIAL, data_f, peridiocidade, cache))
+    latencias, pico, (retorno_contiuo, _, _) = medir(pipeline, repeticoes)
+    resultados = [resumo('dados', configuracao, latencias, pico, len(tickers))]
+
+    latencias, pico, estimativa = medir(lambda: estimar_covariancia(retorno_contiuo, fator), repeticoes)
+    resultados.append(resumo('covariancia', configuracao, latencias, pico, len(tickers)))
+
+    ret_livre = 0.1
+    latencias, pico, simulacao = medir(lambda: simular_carteiras(estimativa.media, estimativa.covariancia, ret_livre,
+                                                                 configuracao['numero_portfolios'], semente=0,
+                                                                 cholesky=estimativa.cholesky),
+                                       repeticoes)
+    resultados.append(resumo('simulacao', configuracao, latencias, pico, configuracao['numero_portfolios']))
+
+    retorno_min, retorno_max = simulacao.retornos_aritm.min(), simulacao.retornos_aritm.max()
+    del simulacao
+    latencias, pico, fronteira = medir(lambda: fronteira_eficiente(estimativa.media, estimativa.covariancia,
+                                                                   retorno_min, retorno_max),
+                                       repeticoes)
+    resultados.append(resumo('fronteira', configuracao, latencias, pico, len(fronteira.retornos)))
+
+    latencias, pico, _ = medir(lambda: carteiras_exatas(estimativa.media, estimativa.covariancia, ret_livre), repeticoes)
+    resultados.append(resumo('otimizacao_exata', configuracao, latencias, pico, 2))
+    return resultados
+
+
+def configuracoes(variacoes):
+    vistas = []
+    for dimensao, valores in variacoes.items():
+        for valor in valores:
+            configuracao = {**CONFIGURACAO_BASE, dimensao: valor}
+            if configuracao not in vistas:
+                vistas.append(configuracao)
+    return vistas
+
+
+def commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(caminho_base, caminho_novo):
+    '''Mostra a razão entre as medianas de latência (novo / base) para as configurações em comum.'''
+    def chave(linha):
+        return (linha['etapa'], linha['n_ativos'], linha['numero_portfolios'], linha['anos'], linha['peridiocidade'])
+    with open(caminho_base, encoding='utf-8') as arquivo:
+        base = {chave(linha): linha for linha in json.load(arquivo)['resultados']}
+    with open(caminho_novo, encoding='utf-8') as arquivo:
+        novo = {chave(linha): linha for linha in json.load(arquivo)['resultados']}
+    for k in sorted(base.keys() & novo.keys(), key=str):
+        razao = novo[k]['p50_s'] / base[k]['p50_s']
+        print(f'{str(k):<60} {base[k]["p50_s"]:>10.4f}s {novo[k]["p50_s"]:>10.4f}s {razao:>7.2f}x')
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description='Benchmarks do motor de Markowitz')
+    parser.add_argument('--saida', default='benchmark.json', help='arquivo JSON de saída')
+    parser.add_argument('--repeticoes', type=int, default=5)
+    parser.add_argument('--rapido', action='store_true', help='usa uma grade menor de configurações')
+    parser.add_argument('--comparar', nargs=2, metavar=('BASE', 'NOVO'), help='compara dois arquivos de resultados')
+    args = parser.parse_args(argumentos)
+
+    if args.comparar:
+        comparar(*args.comparar)
+        return
+
+    resultados = []
+    for configuracao in configuracoes(VARIACOES_RAPIDO if args.rapido else VARIACOES):
+        for linha in executar_configuracao(configuracao, args.repeticoes):
+            print(f"{linha['etapa']:<10} {json.dumps(configuracao, ensure_ascii=False):<90} "
+                  f"p50={linha['p50_s']:.4f}s pico={linha['pico_memoria_mb']:.1f}MB")
+            resultados.append(linha)
+
+    with open(args.saida, 'w', encoding='utf-8') as arquivo:
+        json.dump({'commit': commit_atual(), 'python': platform.python_version(), 'numpy': np.__version__,
+                   'pandas': pd.__version__, 'plataforma': platform.platform(), 'resultados': resultados},
+                  arquivo, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,2 @@
+# ---------------- Motor de cálculo da Teoria de Markowitz ---------------- #
+# módulos sem dependência do Streamlit, usados por 'app_streamlit.py'
@@ -0,0 +1,112 @@
+# ---------------- Backtest walk-forward ---------------- #
+from collections import deque
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from markowitz.otimizacao import carteira_max_sharpe, carteira_min_variancia
+
+
+class EstatisticasMoveis:
+    '''Média e covariância de uma janela de retornos, atualizadas a cada nova observação com uma
+    atualização de posto um (algoritmo de Welford), sem recalcular a janela inteira.'''
+
+    def __init__(self, n_ativos):
+        self.n = 0
+        self.media = np.zeros(n_ativos)
+        self._m2 = np.zeros((n_ativos, n_ativos)) # soma dos produtos dos desvios em relação à média
+
+    def adicionar(self, x):
+        self.n += 1
+        desvio = x - self.media
+        self.media += desvio / self.n
+        self._m2 += np.outer(desvio, x - self.media)
+
+    def remover(self, x):
+        if self.n <= 1:
+            self.__init__(self.media.size)
+            return
+        desvio = x - self.media
+        self.n -= 1
+        self.media -= desvio / self.n
+        self._m2 -= np.outer(desvio, x - self.media)
+
+    def covariancia(self):
+        return (self._m2 + self._m2.T) / (2 * (self.n - 1)) # média com a transposta para manter a simetria
+
+
+@dataclass
+class ResultadoBacktest:
+    retornos: pd.DataFrame  # retorno realizado em cada período: carteira ótima, mínima variância e SELIC
+    pesos_otima: pd.DataFrame  # pesos da carteira ótima em cada data de rebalanceamento
+    pesos_min_variancia: pd.DataFrame  # pesos da carteira de mínima variância em cada data de rebalanceamento
+
+    def acumulado(self): # valor de 1 unidade monetária investida no início do backtest
+        return (1 + self.retornos).cumprod()
+
+
+def retornos_selic(selic, datas, fator_periodicidade):
+    '''Retorno da SELIC (taxa anual em %) em cada período, usando a última taxa conhecida em cada data.'''
+    taxa = selic.reindex(selic.index.union(datas)).ffill().reindex(datas)
+    return (1 + taxa / 100) ** (1 / fator_periodicidade) - 1
+
+
+def backtest_walk_forward(retorno_contiuo, selic, fator_periodicidade, janela, rebalanceamento=1, expansivel=False):
+    '''Reotimiza as carteiras ótima (Sharpe) e de mínima variância a cada 'rebalanceamento' períodos, usando
+    apenas os 'janela' períodos anteriores (ou todos, se 'expansivel'), e acompanha o retorno realizado.
+    Entre rebalanceamentos os pesos variam com os preços. Datas em que alguma ação não tem retorno ficam
+    fora das estatísticas e, no retorno realizado, essa ação rende zero. Cada reotimização parte dos pesos anteriores.'''
+    retorno_contiuo = retorno_contiuo.astype('float64')
+    tickers = list(retorno_contiuo.columns)
+    n_ativos = len(tickers)
+    valores = retorno_contiuo.to_numpy()
+    simples = np.expm1(np.nan_to_num(valores)) # retorno aritmético de cada período
+    completas = ~np.isnan(valores).any(axis=1)
+    selic_periodo = retornos_selic(selic, retorno_contiuo.index, fator_periodicidade).to_numpy()
+    minimo_observacoes = max(2, min(janela, n_ativos + 1))
+
+    estatisticas = EstatisticasMoveis(n_ativos)
+    na_janela = deque()
+    peso_otima = peso_min_var = None
+    pesos_otima, pesos_min_var, datas_rebalanceamento = [], [], []
+    realizados = []
+    ultimo_rebalanceamento = None
+
+    for t, data in enumerate(retorno_contiuo.index):
+        # retorno realizado no período com os pesos escolhidos até o período anterior
+        if peso_otima is not None:
+            realizados.append((data, peso_otima @ simples[t], peso_min_var @ simples[t], selic_periodo[t]))
+            peso_otima = peso_otima * (1 + simples[t])
+            peso_otima /= peso_otima.sum()
+            peso_min_var = peso_min_var * (1 + simples[t])
+            peso_min_var /= peso_min_var.sum()
+
+        # a observação do período entra na janela, e a mais antiga sai se a janela for móvel
+        if completas[t]:
+            estatisticas.adicionar(valores[t])
+            na_janela.append(t)
+            if not expansivel and len(na_janela) > janela:
+                estatisticas.remover(valores[na_janela.popleft()])
+
+        if estatisticas.n < minimo_observacoes:
+            continue
+        if ultimo_rebalanceamento is not None and t - ultimo_rebalanceamento < rebalanceamento:
+            continue
+
+        media = estatisticas.media * fator_periodicidade
+        covariancia = estatisticas.covariancia() * fator_periodicidade
+        inicio_janela = retorno_contiuo.index[na_janela[0]]
+        ret_livre = selic.loc[(selic.index >= inicio_janela) & (selic.index <= data)].mean() / 100
+        peso_otima = carteira_max_sharpe(media, covariancia, ret_livre, pesos_iniciais=peso_otima)
+        peso_min_var = carteira_min_variancia(covariancia, pesos_iniciais=peso_min_var)
+        pesos_otima.append(peso_otima)
+        pesos_min_var.append(peso_min_var)
+        datas_rebalanceamento.append(data)
+        ultimo_rebalanceamento = t
+
+    retornos = pd.DataFrame([linha[1:] for linha in realizados], index=pd.DatetimeIndex([linha[0] for linha in realizados]),
+                            columns=['Carteira Ótima', 'Carteira de Mínima Variância', 'SELIC'])
+    return ResultadoBacktest(retornos=retornos,
+                             pesos_otima=pd.DataFrame(pesos_otima, index=datas_rebalanceamento, columns=tickers),
+                             pesos_min_variancia=pd.DataFrame(pesos_min_var, index=datas_rebalanceamento, columns=tickers))
@@ -0,0 +1,192 @@
+# ---------------- Cache local de preços ---------------- #
+import json
+import os
+import tempfile
+import threading
+
+import pandas as pd
+
+from markowitz.download import DownloaderConcorrente, ListaNegra
+
+
+DIRETORIO_PADRAO = os.environ.get('MARKOWITZ_CACHE', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache_precos'))
+OFFLINE_PADRAO = os.environ.get('MARKOWITZ_OFFLINE', '0') == '1'  # com '1' nenhuma requisição é feita ao Yahoo Finance
+# 'guardar' relê e regrava 'cobertura.json' e o parquet do ticker; a trava evita que duas instâncias (ou sessões)
+# no mesmo processo apaguem as gravações uma da outra
+_trava_gravacao = threading.Lock()
+INICIO_HISTORICO = pd.Timestamp('1970-01-01')  # início da consulta ao histórico completo de um ticker
+
+
+def _juntar_intervalos(intervalos): # une intervalos sobrepostos ou encostados
+    intervalos = sorted(intervalos)
+    unidos = []
+    for inicio, fim in intervalos:
+        if unidos and inicio <= unidos[-1][1]:
+            unidos[-1][1] = max(unidos[-1][1], fim)
+        else:
+            unidos.append([inicio, fim])
+    return unidos
+
+
+def intervalos_faltantes(cobertura, inicio, fim):
+    '''Retorna os trechos de [inicio, fim) que não estão contidos nos intervalos de 'cobertura'.'''
+    faltantes = []
+    cursor = inicio
+    for c_inicio, c_fim in _juntar_intervalos(cobertura):
+        if c_fim <= cursor:
+            continue
+        if c_inicio >= fim:
+            break
+        if c_inicio > cursor:
+            faltantes.append((cursor, c_inicio))
+        cursor = max(cursor, c_fim)
+    if cursor < fim:
+        faltantes.append((cursor, fim))
+    return faltantes
+
+
+def _consultados(faltantes):
+    # dias futuros não são marcados como consultados, pois ainda podem ganhar preços
+    hoje = pd.Timestamp.today().normalize()
+    return [(f_inicio, min(f_fim, hoje)) for f_inicio, f_fim in faltantes if f_inicio < hoje]
+
+
+class CachePrecos:
+    '''Armazena em disco (parquet, um arquivo por ticker) os preços já baixados e os intervalos de datas
+    consultados, de forma que apenas os trechos ainda não consultados sejam baixados. Tickers cujas requisições
+    falham seguidamente, ou que não têm preços em todo o histórico, são registrados na lista negra do diretório
+    ('lista_negra.json'); um ticker apenas sem preços no período consultado não conta como falha.'''
+
+    def __init__(self, diretorio=DIRETORIO_PADRAO, offline=OFFLINE_PADRAO, downloader=None):
+        self.diretorio = diretorio
+        self.offline = offline
+        self.downloader = downloader or DownloaderConcorrente()
+        os.makedirs(diretorio, exist_ok=True)
+        self.lista_negra = ListaNegra(os.path.join(diretorio, 'lista_negra.json'))
+        self._arquivo_cobertura = os.path.join(diretorio, 'cobertura.json')
+        self._versao_cobertura = None
+        self._cobertura = {}
+
+    def _ler_cobertura(self):
+        # relê 'cobertura.json' só se o arquivo mudou desde a última leitura (ex.: gravado por outra instância)
+        if not os.path.exists(self._arquivo_cobertura):
+            return self._cobertura
+        estado = os.stat(self._arquivo_cobertura)
+        versao = (estado.st_mtime_ns, estado.st_size, estado.st_ino)
+        if versao != self._versao_cobertura:
+            with open(self._arquivo_cobertura, encoding='utf-8') as arquivo:
+                self._cobertura = json.load(arquivo)
+            self._versao_cobertura = versao
+        return self._cobertura
+
+    def _gravar(self, caminho, escrever): # grava em arquivo temporário e substitui, evitando arquivos corrompidos
+        descritor, temporario = tempfile.mkstemp(dir=self.diretorio)
+        os.close(descritor)
+        try:
+            escrever(temporario)
+            os.replace(temporario, caminho)
+        finally:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+
+    def _caminho(self, ticker):
+        return os.path.join(self.diretorio, f'{ticker}.parquet')
+
+    def _ler_precos(self, ticker):
+        caminho = self._caminho(ticker)
+        if not os.path.exists(caminho):
+            return pd.Series(dtype='float64', name=ticker, index=pd.DatetimeIndex([], name='Date'))
+        return pd.read_parquet(caminho)['preco'].rename(ticker)
+
+    def cobertura(self, ticker): # intervalos [inicio, fim) já consultados para o ticker
+        return [(pd.Timestamp(i), pd.Timestamp(f)) for i, f in self._ler_cobertura().get(ticker, [])]
+
+    def guardar(self, ticker, precos, intervalos):
+        '''Junta 'precos' aos preços em disco e marca 'intervalos' como consultados. A cobertura é relida do disco
+        antes de gravar, preservando o que outras instâncias no mesmo diretório já gravaram.'''
+        precos = pd.Series(precos, dtype='float64').dropna()
+        precos.index = pd.DatetimeIndex(precos.index).tz_localize(None).normalize()
+        with _trava_gravacao:
+            existentes = self._ler_precos(ticker)
+            tabela = pd.concat([existentes, precos])
+            tabela = tabela[~tabela.index.duplicated(keep='last')].sort_index()
+            tabela.index.name = 'Date'
+            self._gravar(self._caminho(ticker), lambda caminho: tabela.to_frame('preco').to_parquet(caminho))
+
+            cobertura_atual = dict(self._ler_cobertura())
+            cobertura = self.cobertura(ticker) + [(pd.Timestamp(i), pd.Timestamp(f)) for i, f in intervalos]
+            cobertura_atual[ticker] = [[i.isoformat(), f.isoformat()] for i, f in _juntar_intervalos(cobertura)]
+            def escrever(caminho):
+                with open(caminho, 'w', encoding='utf-8') as arquivo:
+                    json.dump(cobertura_atual, arquivo)
+            self._gravar(self._arquivo_cobertura, escrever)
+            self._cobertura, self._versao_cobertura = cobertura_atual, None
+
+    def faltantes(self, ticker, inicio, fim):
+        return intervalos_faltantes(self.cobertura(ticker), pd.Timestamp(inicio), pd.Timestamp(fim))
+
+    @staticmethod
+    def _recortar(tabela, inicio, fim):
+        return tabela.loc[(tabela.index >= inicio) & (tabela.index < fim)]
+
+    def precos_lote(self, tickers, inicio, fim):
+        '''Preços de vários tickers em [inicio, fim) com o downloader concorrente: os tickers com os mesmos trechos
+        faltantes são baixados juntos, em requisições em lote. Retorna (dicionário ticker -> preços, dicionário
+        ticker -> erro); tickers com erro não alteram o cache e ficam de fora do resultado.'''
+        inicio, fim = pd.Timestamp(inicio), pd.Timestamp(fim)
+        grupos = {}
+        for ticker in dict.fromkeys(tickers):
+            faltantes = [] if self.offline else self.faltantes(ticker, inicio, fim)
+            grupos.setdefault(tuple(faltantes), []).append(ticker)
+
+        erros, sucessos, falhas_lista = {}, [], {}
+        for faltantes, grupo in grupos.items():
+            baixados = {ticker: [] for ticker in grupo}
+            for f_inicio, f_fim in faltantes:
+                series, falhas = self.downloader.baixar([i for i in grupo if i not in erros], f_inicio, f_fim)
+                for ticker, serie in series.items():
+                    baixados[ticker].append(serie)
+                for ticker, erro in falhas.items():
+                    if isinstance(erro, Exception):
+                        # falha de requisição: o ticker não é gravado, será tentado de novo e conta na lista negra
+                        erros[ticker] = falhas_lista[ticker] = erro
+            sem_historico = []
+            for ticker in grupo:
+                if ticker in erros or not faltantes:
+                    continue
+                if not baixados[ticker] and self._ler_precos(ticker).empty:
+                    sem_historico.append(ticker) # nenhum preço nem no cache: consulta o histórico completo
+                    continue
+                sucessos.append(ticker)
+                self.guardar(ticker, pd.concat(baixados[ticker]) if baixados[ticker] else pd.Series(dtype='float64'),
+                             _consultados(faltantes))
+            if sem_historico:
+                self._consultar_historico(sem_historico, erros, sucessos, falhas_lista)
+        if not self.offline:
+            self.lista_negra.atualizar(sucessos, falhas_lista)
+
+        resultado = {}
+        for ticker in dict.fromkeys(tickers):
+            if ticker in erros:
+                continue
+            tabela = self._recortar(self._ler_precos(ticker), inicio, fim)
+            if tabela.empty: # ex.: ação listada depois do período, apenas informada, sem entrar na lista negra
+                erros[ticker] = 'sem preços no período'
+            else:
+                resultado[ticker] = tabela
+        return resultado, erros
+
+    def _consultar_historico(self, tickers, erros, sucessos, falhas_lista):
+        # tickers sem preços no trecho consultado e sem nada em cache: só contam na lista negra se não tiverem preços
+        # em todo o histórico; se tiverem, o histórico completo é gravado e o período consultado fica coberto
+        hoje = pd.Timestamp.today().normalize()
+        series, falhas = self.downloader.baixar(tickers, INICIO_HISTORICO, hoje + pd.Timedelta(days=1))
+        for ticker in tickers:
+            if ticker in series:
+                sucessos.append(ticker)
+                self.guardar(ticker, series[ticker], [(INICIO_HISTORICO, hoje)])
+            elif isinstance(falhas.get(ticker), Exception):
+                erros[ticker] = falhas_lista[ticker] = falhas[ticker]
+            else:
+                erros[ticker] = falhas_lista[ticker] = 'sem preços em todo o histórico'
+
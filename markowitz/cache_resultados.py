@@ -0,0 +1,154 @@
+# ---------------- Cache de resultados da sessão ---------------- #
+from collections import OrderedDict
+from dataclasses import fields
+
+import pandas as pd
+
+from markowitz.covariancia import atualizar_estimativa, estimar_covariancia
+from markowitz.fronteira import NUMERO_PONTOS_PADRAO
+from markowitz.motor import FATORES_PERIODICIDADE, baixar_precos, otimizar_com_estimativa
+
+
+LIMITE_BYTES_CARTEIRAS = 256 * 2 ** 20  # memória máxima das nuvens de simulação guardadas por sessão
+
+
+def bytes_carteiras(resultado):
+    '''Estimativa da memória (bytes) dos arrays da simulação e da fronteira de um 'ResultadoCarteiras'.'''
+    return sum(getattr(getattr(parte, campo.name), 'nbytes', 0)
+               for parte in (resultado.simulacao, resultado.fronteira) for campo in fields(parte))
+
+
+class CacheLRU:
+    '''Dicionário de tamanho limitado: ao passar da capacidade (número de itens) ou, se informado, de 'limite_bytes'
+    (medido por 'tamanho'), remove os itens usados há mais tempo. Um item maior que 'limite_bytes' não é guardado.'''
+
+    def __init__(self, capacidade, limite_bytes=None, tamanho=None):
+        self.capacidade = capacidade
+        self.limite_bytes = limite_bytes
+        self.tamanho = tamanho
+        self._itens = OrderedDict()
+        self._bytes = {}
+        self.acertos = 0
+        self.faltas = 0
+
+    def __contains__(self, chave):
+        return chave in self._itens
+
+    def __len__(self):
+        return len(self._itens)
+
+    def get(self, chave, padrao=None):
+        if chave not in self._itens:
+            return padrao
+        self._itens.move_to_end(chave)
+        return self._itens[chave]
+
+    def put(self, chave, valor):
+        if self.limite_bytes is not None:
+            tamanho = self.tamanho(valor)
+            if tamanho > self.limite_bytes:
+                self._remover(chave)
+                return
+            self._bytes[chave] = tamanho
+        self._itens[chave] = valor
+        self._itens.move_to_end(chave)
+        while len(self._itens) > self.capacidade or self.bytes > (self.limite_bytes or float('inf')):
+            self._remover(next(iter(self._itens)))
+
+    def _remover(self, chave):
+        self._itens.pop(chave, None)
+        self._bytes.pop(chave, None)
+
+    @property
+    def bytes(self): # memória dos itens guardados, se houver 'limite_bytes'
+        return sum(self._bytes.values())
+
+    def obter(self, chave, calcular): # retorna o valor em cache ou calcula e guarda
+        if chave in self._itens:
+            self.acertos += 1
+            return self.get(chave)
+        self.faltas += 1
+        valor = calcular()
+        self.put(chave, valor)
+        return valor
+
+    def itens_recentes(self): # do mais recente para o mais antigo
+        return reversed(list(self._itens.items()))
+
+
+class SessaoCalculo:
+    '''Guarda os resultados intermediários (preços, painel, estimativa de covariância, simulação e fronteira)
+    de uma sessão, para que um rerun do Streamlit com os mesmos parâmetros não refaça os cálculos. Ao incluir ou
+    retirar ações, apenas os preços das ações incluídas são lidos e a estimativa de covariância parte da última
+    estimativa com as mesmas datas e periodicidade.'''
+
+    def __init__(self, cache_precos, capacidade_series=256, capacidade_paineis=16, capacidade_estimativas=32,
+                 capacidade_carteiras=4, limite_bytes_carteiras=LIMITE_BYTES_CARTEIRAS):
+        self.cache_precos = cache_precos
+        self.series = CacheLRU(capacidade_series)
+        self.paineis = CacheLRU(capacidade_paineis)
+        self.estimativas = CacheLRU(capacidade_estimativas)
+        # nuvens de simulação podem ocupar muita memória (4 arrays float64 por carteira), por isso o limite em bytes
+        self.carteiras = CacheLRU(capacidade_carteiras, limite_bytes_carteiras, bytes_carteiras)
+
+    def precos_lote(self, tickers, inicio, fim): # mesma interface de 'CachePrecos.precos_lote'
+        inicio, fim = pd.Timestamp(inicio), pd.Timestamp(fim)
+        resultado = {}
+        for ticker in tickers:
+            if (ticker, inicio, fim) in self.series:
+                self.series.acertos += 1
+                resultado[ticker] = self.series.get((ticker, inicio, fim))
+        pendentes = [i for i in tickers if i not in resultado]
+        self.series.faltas += len(pendentes)
+        erros = {}
+        if pendentes:
+            baixados, erros = self.cache_precos.precos_lote(pendentes, inicio, fim)
+            for ticker, serie in baixados.items(): # tickers com erro não são guardados e serão tentados de novo
+                self.series.put((ticker, inicio, fim), serie)
+            resultado.update(baixados)
+        return resultado, erros
+
+    @staticmethod
+    def _obter_se_completo(cache, chave, tickers, calcular):
+        # resultados de um painel incompleto (falha no download de algum ticker) não são guardados, para que o
+        # próximo rerun tente de novo os tickers que faltaram; 'calcular' retorna (valor, tickers do painel)
+        if chave in cache:
+            return cache.obter(chave, None)
+        cache.faltas += 1
+        valor, tickers_painel = calcular()
+        if len(tickers_painel) == len(tickers):
+            cache.put(chave, valor)
+        return valor
+
+    def painel(self, tickers, data_i, data_f, peridiocidade):
+        chave = (tuple(tickers), pd.Timestamp(data_i), pd.Timestamp(data_f), peridiocidade)
+        def calcular():
+            painel = baixar_precos(tickers, data_i, data_f, peridiocidade, self)
+            return painel, painel.tickers
+        return self._obter_se_completo(self.paineis, chave, tickers, calcular)
+
+    def estimativa(self, tickers, data_i, data_f, peridiocidade, encolhimento=False, painel=None):
+        '''Estimativa de covariância das ações; 'painel' evita ler de novo um painel que o chamador já tem.'''
+        chave = (tuple(tickers), pd.Timestamp(data_i), pd.Timestamp(data_f), peridiocidade, bool(encolhimento))
+
+        def calcular():
+            painel_atual = painel if painel is not None else self.painel(tickers, data_i, data_f, peridiocidade)
+            retornos = painel_atual.retornos
+            if not encolhimento:
+                for (tickers_anteriores, *resto), anterior in self.estimativas.itens_recentes():
+                    if tuple(resto) == chave[1:] and set(tickers_anteriores) & set(tickers):
+                        return atualizar_estimativa(anterior, retornos), painel_atual.tickers
+            return estimar_covariancia(retornos, FATORES_PERIODICIDADE[peridiocidade], encolhimento), painel_atual.tickers
+        return self._obter_se_completo(self.estimativas, chave, tickers, calcular)
+
+    def carteiras_otimas(self, tickers, data_i, data_f, peridiocidade, numero_portfolios, ret_livre,
+                         numero_pontos=NUMERO_PONTOS_PADRAO, semente=None, encolhimento=False, painel=None):
+        chave = (tuple(tickers), pd.Timestamp(data_i), pd.Timestamp(data_f), peridiocidade, int(numero_portfolios),
+                 semente, int(numero_pontos), bool(encolhimento))
+        def calcular():
+            estimativa = self.estimativa(tickers, data_i, data_f, peridiocidade, encolhimento, painel)
+            resultado = otimizar_com_estimativa(estimativa, ret_livre, numero_portfolios, numero_pontos, semente)
+            return resultado, estimativa.tickers
+        if semente is None: # sem semente a simulação muda a cada execução e não pode ser reaproveitada
+            return calcular()[0]
+        return self._obter_se_completo(self.carteiras, chave, tickers, calcular)
@@ -0,0 +1,109 @@
+# ---------------- Estimativa de covariância ---------------- #
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from scipy.linalg import solve_triangular
+
+from markowitz.instrumentacao import etapa
+
+
+@dataclass
+class EstimativaCovariancia:
+    tickers: list
+    media: np.ndarray  # média anualizada dos retornos contínuos
+    covariancia: np.ndarray  # matriz de covariância anualizada (contígua, float64)
+    cholesky: np.ndarray  # fator triangular inferior L, com covariancia = L @ L.T
+    fator_periodicidade: int
+    encolhimento: float  # intensidade do encolhimento de Ledoit-Wolf (0 = covariância amostral)
+    datas: pd.Index = None  # datas (todas as ações com retorno) usadas na covariância
+
+
+def ledoit_wolf(retornos):
+    '''Covariância com encolhimento de Ledoit-Wolf (2004) em direção a um múltiplo da identidade.
+    Retorna a matriz e a intensidade do encolhimento.'''
+    n_observacoes, n_ativos = retornos.shape
+    centralizados = retornos - retornos.mean(axis=0)
+    amostral = centralizados.T @ centralizados / n_observacoes
+    alvo = np.trace(amostral) / n_ativos
+    distancia = ((amostral - alvo * np.eye(n_ativos)) ** 2).sum() / n_ativos
+    quadrados = centralizados ** 2
+    variancia_estimativa = ((quadrados.T @ quadrados) / n_observacoes - amostral ** 2).sum() / (n_ativos * n_observacoes)
+    intensidade = 0.0 if distancia == 0 else min(variancia_estimativa, distancia) / distancia
+    covariancia = (1 - intensidade) * amostral
+    covariancia.flat[::n_ativos + 1] += intensidade * alvo
+    return covariancia, intensidade
+
+
+def fator_cholesky(covariancia):
+    '''Fator de Cholesky; se a matriz não for positiva definida, soma um valor mínimo à diagonal.'''
+    ajuste = 0.0
+    escala = max(np.trace(covariancia) / covariancia.shape[0], np.finfo(float).tiny)
+    while True:
+        try:
+            return np.linalg.cholesky(covariancia + ajuste * np.eye(covariancia.shape[0]))
+        except np.linalg.LinAlgError:
+            ajuste = escala * 1e-12 if ajuste == 0 else ajuste * 10
+
+
+@etapa('covariancia')
+def estimar_covariancia(retornos, fator_periodicidade, encolhimento=False):
+    '''Calcula uma única vez a média e a covariância anualizadas dos retornos contínuos.
+    A média usa todos os dados de cada ação; a covariância usa apenas as datas em que todas as ações
+    têm retorno, o que a mantém positiva semidefinida.'''
+    retornos = pd.DataFrame(retornos)
+    media = retornos.mean(axis=0).to_numpy(dtype=np.float64) * fator_periodicidade
+    tabela_completos = retornos.dropna()
+    completos = tabela_completos.to_numpy(dtype=np.float64)
+    if encolhimento:
+        covariancia, intensidade = ledoit_wolf(completos)
+    else:
+        covariancia, intensidade = np.cov(completos, rowvar=False, ddof=1).reshape(len(media), len(media)), 0.0
+    covariancia = np.ascontiguousarray(covariancia * fator_periodicidade)
+    return EstimativaCovariancia(tickers=list(retornos.columns), media=media, covariancia=covariancia,
+                                 cholesky=fator_cholesky(covariancia), fator_periodicidade=fator_periodicidade,
+                                 encolhimento=float(intensidade), datas=tabela_completos.index)
+
+
+@etapa('covariancia')
+def atualizar_estimativa(anterior, retornos, encolhimento=False):
+    '''Estimativa para um novo conjunto de ações reaproveitando 'anterior': das ações que continuam vêm a média e
+    o bloco da covariância, e apenas as linhas e colunas das ações incluídas são calculadas. Se as ações incluídas
+    estiverem no fim, o fator de Cholesky também é apenas estendido. Com encolhimento, ou se as datas completas
+    mudarem (ex.: ação incluída com histórico menor), a estimativa é refeita por inteiro.'''
+    retornos = pd.DataFrame(retornos)
+    fator_periodicidade = anterior.fator_periodicidade
+    tickers = list(retornos.columns)
+    posicao = {ticker: i for i, ticker in enumerate(anterior.tickers)}
+    tabela_completos = retornos.dropna()
+    if (encolhimento or anterior.encolhimento != 0 or anterior.datas is None
+            or not tabela_completos.index.equals(anterior.datas) or not posicao.keys() & set(tickers)):
+        return estimar_covariancia(retornos, fator_periodicidade, encolhimento)
+
+    mantidos = [i for i, ticker in enumerate(tickers) if ticker in posicao]
+    incluidos = [i for i, ticker in enumerate(tickers) if ticker not in posicao]
+    origem = [posicao[tickers[i]] for i in mantidos]
+
+    media = np.empty(len(tickers))
+    media[mantidos] = anterior.media[origem]
+    covariancia = np.empty((len(tickers), len(tickers)))
+    covariancia[np.ix_(mantidos, mantidos)] = anterior.covariancia[np.ix_(origem, origem)]
+    if incluidos:
+        media[incluidos] = retornos.iloc[:, incluidos].mean(axis=0).to_numpy(dtype=np.float64) * fator_periodicidade
+        completos = tabela_completos.to_numpy(dtype=np.float64)
+        centralizados = completos - completos.mean(axis=0)
+        colunas = centralizados.T @ centralizados[:, incluidos] / (len(completos) - 1) * fator_periodicidade
+        covariancia[:, incluidos] = colunas
+        covariancia[incluidos, :] = colunas.T
+
+    n_anterior = len(anterior.tickers)
+    if tickers[:n_anterior] == anterior.tickers and incluidos:
+        # L = [[L11, 0], [L21, L22]], com L21 = (L11^-1 C12)' e L22 = chol(C22 - L21 L21')
+        l21 = solve_triangular(anterior.cholesky, covariancia[:n_anterior, n_anterior:], lower=True).T
+        l22 = fator_cholesky(covariancia[n_anterior:, n_anterior:] - l21 @ l21.T)
+        cholesky = np.block([[anterior.cholesky, np.zeros((n_anterior, len(incluidos)))], [l21, l22]])
+    else:
+        cholesky = fator_cholesky(covariancia)
+    return EstimativaCovariancia(tickers=tickers, media=media, covariancia=np.ascontiguousarray(covariancia),
+                                 cholesky=cholesky, fator_periodicidade=fator_periodicidade, encolhimento=0.0,
+                                 datas=tabela_completos.index)
@@ -0,0 +1,49 @@
+# ---------------- Dados de referência ---------------- #
+# arquivos da pasta 'arquivos_csv', lidos uma única vez por processo (vale para todos os reruns e sessões do Streamlit)
+import os
+from functools import lru_cache
+
+import pandas as pd
+
+
+DIRETORIO_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'arquivos_csv')
+
+
+@lru_cache(maxsize=None)
+def carregar_acoes():
+    '''Tabela com 'Código' e 'Subsetor Bovespa' das ações com tickers de 5 caracteres.'''
+    acoes = pd.read_csv(os.path.join(DIRETORIO_CSV, 'base_acoes.csv'), sep=';', encoding='utf-8-sig',
+                        usecols=['Código', 'Subsetor Bovespa'])
+    acoes = acoes[acoes['Código'].astype(str).str.len() == 5].reset_index(drop=True)
+    acoes['Subsetor Bovespa'] = acoes['Subsetor Bovespa'].astype('category')
+    return acoes
+
+
+@lru_cache(maxsize=None)
+def carregar_acoes_erro():
+    '''Tickers (sem '.SA') que deram problema com o Yahoo Finance.'''
+    acoes_erro = pd.read_csv(os.path.join(DIRETORIO_CSV, 'erro_acao.csv'), sep=';', encoding='utf-8-sig')
+    return frozenset(acoes_erro.iloc[:, 1].astype(str).str[:5])
+
+
+@lru_cache(maxsize=None)
+def carregar_selic():
+    '''Série numérica da taxa SELIC (% a.a.) indexada pela data.'''
+    selic = pd.read_csv(os.path.join(DIRETORIO_CSV, 'selic.csv'), sep=';', encoding='utf-8-sig', decimal=',')
+    selic['Data'] = pd.to_datetime(selic['Data'], dayfirst=True)
+    return selic.set_index('Data')['Taxa SELIC'].astype('float64').sort_index()
+
+
+@lru_cache(maxsize=None)
+def acoes_por_subsetor():
+    '''Dicionário subsetor -> tickers (sem '.SA') ordenados, já sem as ações de 'erro_acao.csv'.'''
+    acoes = carregar_acoes()
+    acoes = acoes[~acoes['Código'].isin(carregar_acoes_erro())]
+    return {subsetor: tuple(sorted(grupo['Código']))
+            for subsetor, grupo in acoes.groupby('Subsetor Bovespa', observed=True)}
+
+
+def taxa_livre_risco(data_i, data_f):
+    '''Média da SELIC no intervalo selecionado, em formato decimal.'''
+    selic = carregar_selic()
+    return selic.loc[(selic.index >= data_i) & (selic.index <= data_f)].dropna().mean() / 100
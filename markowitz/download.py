@@ -0,0 +1,161 @@
+# ---------------- Download concorrente de preços ---------------- #
+import contextvars
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from markowitz.instrumentacao import etapa, evento
+
+
+MAX_THREADS_PADRAO = 4
+TAMANHO_LOTE_PADRAO = 25  # tickers por requisição
+TENTATIVAS_PADRAO = 3
+ESPERA_INICIAL_PADRAO = 1.0  # segundos antes da 2ª tentativa, dobrando a cada nova tentativa
+TIMEOUT_PADRAO = 20  # segundos por requisição
+LIMITE_FALHAS_PADRAO = 2  # downloads seguidos com falha até o ticker entrar na lista negra
+
+
+def baixar_lote_yahoo(tickers, inicio, fim, timeout=TIMEOUT_PADRAO):
+    '''Preços de fechamento ajustados de vários tickers em uma única requisição ao Yahoo Finance (uma coluna por ticker).'''
+    import yfinance as yf
+    tabela = yf.download(list(tickers), start=inicio, end=fim, progress=False, threads=False, timeout=timeout,
+                         auto_adjust=False, group_by='column')['Adj Close']
+    if isinstance(tabela, pd.Series):
+        tabela = tabela.to_frame(tickers[0])
+    return tabela
+
+
+class FonteLocal:
+    '''Substitui o Yahoo Finance por uma tabela de preços em memória (uma coluna por ticker), com a mesma interface
+    de 'baixar_lote_yahoo'. Tickers em 'falhas' não retornam preços; 'erros_transitorios' faz as primeiras
+    requisições falharem, e 'atraso' simula a latência da rede.'''
+
+    def __init__(self, precos, falhas=(), erros_transitorios=0, atraso=0.0):
+        self.precos = precos
+        self.falhas = set(falhas)
+        self.erros_transitorios = erros_transitorios
+        self.atraso = atraso
+        self.requisicoes = 0
+        self._trava = threading.Lock()
+
+    def __call__(self, tickers, inicio, fim, timeout=TIMEOUT_PADRAO):
+        with self._trava:
+            self.requisicoes += 1
+            falhar = self.requisicoes <= self.erros_transitorios
+        time.sleep(self.atraso)
+        if falhar:
+            raise ConnectionError('falha simulada da fonte de preços')
+        colunas = [i for i in tickers if i in self.precos.columns and i not in self.falhas]
+        tabela = self.precos.loc[(self.precos.index >= inicio) & (self.precos.index < fim), colunas]
+        return tabela.reindex(columns=list(tickers))
+
+
+class ListaNegra:
+    '''Tickers que falharam em 'limite_falhas' downloads seguidos, gravados em um arquivo JSON local. Um download com
+    sucesso zera a contagem do ticker e o retira da lista.'''
+
+    def __init__(self, caminho, limite_falhas=LIMITE_FALHAS_PADRAO):
+        self.caminho = caminho
+        self.limite_falhas = limite_falhas
+        self._trava = threading.Lock()
+
+    def _ler(self):
+        if not os.path.exists(self.caminho):
+            return {}
+        with open(self.caminho, encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+
+    def _gravar(self, registros):
+        diretorio = os.path.dirname(os.path.abspath(self.caminho))
+        os.makedirs(diretorio, exist_ok=True)
+        descritor, temporario = tempfile.mkstemp(dir=diretorio)
+        with os.fdopen(descritor, 'w', encoding='utf-8') as arquivo:
+            json.dump(registros, arquivo, ensure_ascii=False, indent=2)
+        os.replace(temporario, self.caminho)
+
+    def atualizar(self, sucessos, falhas):
+        '''Zera a contagem dos tickers em 'sucessos' e soma uma falha aos de 'falhas' (dicionário ticker -> erro).'''
+        if not sucessos and not falhas:
+            return
+        with self._trava:
+            registros = self._ler()
+            for ticker in sucessos:
+                registros.pop(ticker, None)
+            for ticker, erro in falhas.items():
+                registro = registros.setdefault(ticker, {'falhas': 0})
+                registro['falhas'] += 1
+                registro['erro'] = str(erro)
+                registro['data'] = pd.Timestamp.now().isoformat(timespec='seconds')
+            self._gravar(registros)
+
+    def tickers(self): # tickers ('.SA') bloqueados
+        return {ticker for ticker, registro in self._ler().items() if registro['falhas'] >= self.limite_falhas}
+
+    def codigos(self): # códigos sem '.SA', no formato de 'base_acoes.csv'
+        return {ticker[:5] for ticker in self.tickers()}
+
+
+class DownloaderConcorrente:
+    '''Baixa vários tickers com requisições em lote executadas em paralelo por um número limitado de threads,
+    com novas tentativas (espera exponencial) e tempo limite por requisição. Tickers sem preços ficam de fora
+    do resultado, junto com o motivo da falha.'''
+
+    def __init__(self, baixar_lote=baixar_lote_yahoo, max_threads=MAX_THREADS_PADRAO,
+                 tamanho_lote=TAMANHO_LOTE_PADRAO, tentativas=TENTATIVAS_PADRAO, espera_inicial=ESPERA_INICIAL_PADRAO,
+                 timeout=TIMEOUT_PADRAO):
+        self.baixar_lote = baixar_lote
+        self.max_threads = max_threads
+        self.tamanho_lote = tamanho_lote
+        self.tentativas = tentativas
+        self.espera_inicial = espera_inicial
+        self.timeout = timeout
+
+    def _baixar_com_tentativas(self, lote, inicio, fim):
+        # retorna (tabela, erro, segundos com todas as tentativas e esperas, número de tentativas)
+        inicio_lote = time.perf_counter()
+        for tentativa in range(1, self.tentativas + 1):
+            inicio_requisicao = time.perf_counter()
+            try:
+                tabela = self.baixar_lote(lote, inicio, fim, timeout=self.timeout)
+                evento('download_lote', tickers=list(lote), tentativa=tentativa,
+                       segundos=time.perf_counter() - inicio_requisicao)
+                return tabela, None, time.perf_counter() - inicio_lote, tentativa
+            except Exception as erro:
+                evento('download_lote', tickers=list(lote), tentativa=tentativa,
+                       segundos=time.perf_counter() - inicio_requisicao, erro=str(erro))
+                ultimo_erro = erro
+                if tentativa < self.tentativas:
+                    time.sleep(self.espera_inicial * 2 ** (tentativa - 1) * (1 + random.random() / 2))
+        return None, ultimo_erro, time.perf_counter() - inicio_lote, self.tentativas
+
+    def baixar(self, tickers, inicio, fim):
+        '''Retorna (dicionário ticker -> série de preços, dicionário ticker -> erro). Erros de requisição ficam como
+        exceção; tickers que a fonte respondeu sem preços ficam com o texto 'sem preços no período'. A latência de
+        cada ticker (a do seu lote, com as novas tentativas) é registrada no evento 'download_ticker'.'''
+        tickers = list(dict.fromkeys(tickers))
+        lotes = [tickers[i:i + self.tamanho_lote] for i in range(0, len(tickers), self.tamanho_lote)]
+        series, falhas = {}, {}
+        with etapa('download_concorrente'), ThreadPoolExecutor(max_workers=self.max_threads) as executor:
+            # cada thread roda em uma cópia do contexto atual, para que os eventos cheguem à instrumentação ativa
+            contextos = [contextvars.copy_context() for _ in lotes]
+            resultados = executor.map(lambda contexto, lote: (lote, *contexto.run(self._baixar_com_tentativas, lote, inicio, fim)),
+                                      contextos, lotes)
+            for lote, tabela, erro, segundos, tentativas in resultados:
+                for ticker in lote:
+                    if erro is not None:
+                        falhas[ticker] = erro
+                    else:
+                        serie = tabela[ticker].dropna() if ticker in tabela.columns else pd.Series(dtype='float64')
+                        if serie.empty:
+                            falhas[ticker] = 'sem preços no período'
+                        else:
+                            series[ticker] = serie.astype('float64').rename(ticker)
+                    evento('download_ticker', ticker=ticker, segundos=segundos, tentativas=tentativas, lote=len(lote),
+                           **({'erro': str(falhas[ticker])} if ticker in falhas else {}))
+        return series, falhas
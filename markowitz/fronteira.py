@@ -0,0 +1,118 @@
+# ---------------- Fronteira eficiente ---------------- #
+from dataclasses import dataclass
+
+import numpy as np
+from scipy.optimize import minimize
+
+from markowitz.instrumentacao import etapa, evento
+
+
+NUMERO_PONTOS_PADRAO = 200
+
+
+@dataclass
+class FronteiraEficiente:
+    retornos: np.ndarray  # retorno aritmético de cada ponto da fronteira
+    volatilidades: np.ndarray  # menor risco possível para cada retorno
+    pesos: np.ndarray  # pesos da carteira de cada ponto, uma linha por ponto
+    iteracoes: np.ndarray  # iterações (conjunto ativo ou SLSQP) em cada ponto
+
+
+def _conjunto_ativo(matriz_2, restricoes, alvo, livres):
+    '''Resolve min w'Mw com restricoes @ w = alvo e w >= 0 pelas condições de KKT, partindo do conjunto
+    de ativos 'livres' (com peso positivo) do ponto anterior. Retorna None se não convergir.'''
+    livres = livres.copy()
+    n_restricoes = restricoes.shape[0]
+    tolerancia_pesos = 1e-12
+    tolerancia_multiplicadores = 1e-12 * np.abs(matriz_2).max()
+    for iteracao in range(1, 2 * livres.size + 10):
+        f = np.flatnonzero(livres)
+        b = np.flatnonzero(~livres)
+        a_f = restricoes[:, f]
+        kkt = np.block([[matriz_2[np.ix_(f, f)], -a_f.T], [a_f, np.zeros((n_restricoes, n_restricoes))]])
+        lado_direito = np.concatenate([np.zeros(f.size), alvo])
+        try:
+            solucao = np.linalg.solve(kkt, lado_direito)
+        except np.linalg.LinAlgError: # ex.: um único ativo livre, comum nas pontas da fronteira
+            solucao = np.linalg.lstsq(kkt, lado_direito, rcond=None)[0]
+        pesos_f, lambdas = solucao[:f.size], solucao[f.size:]
+        if not np.allclose(a_f @ pesos_f, alvo, rtol=1e-9, atol=1e-12): # retorno alvo impossível com esses ativos
+            return None
+        if pesos_f.min() < -tolerancia_pesos: # ativos com peso negativo saem do conjunto livre
+            livres[f[pesos_f < -tolerancia_pesos]] = False
+            continue
+        pesos = np.zeros(livres.size)
+        pesos[f] = np.maximum(pesos_f, 0)
+        if b.size:
+            multiplicadores = matriz_2[b] @ pesos - restricoes[:, b].T @ lambdas
+            if multiplicadores.min() < -tolerancia_multiplicadores: # ativo que reduz o risco volta ao conjunto livre
+                livres[b[np.argmin(multiplicadores)]] = True
+                continue
+        return pesos, livres, iteracao
+    return None
+
+
+@etapa('fronteira')
+def fronteira_eficiente(media_retor, covariancia, retorno_min, retorno_max, numero_pontos=NUMERO_PONTOS_PADRAO,
+                        limites=(0, 1), pesos_iniciais=None):
+    '''Calcula a fronteira eficiente entre 'retorno_min' e 'retorno_max' (retornos aritméticos).
+    Com os limites (0,1) cada ponto é resolvido pelo método do conjunto ativo, partindo dos ativos livres
+    do ponto anterior; nos demais casos, ou se o método não convergir, usa o SLSQP partindo da solução
+    anterior e com gradientes analíticos da variância e das restrições, que são lineares nos pesos.
+    'media_retor' e 'covariancia' já devem estar anualizadas.'''
+    media_periodo = np.asarray(media_retor, dtype=np.float64)
+    matriz_periodo = np.ascontiguousarray(covariancia, dtype=np.float64)
+    n_ativos = media_periodo.shape[0]
+    uns = np.ones(n_ativos)
+    restricoes_lineares = np.vstack([uns, media_periodo])
+
+    # minimizar a variância leva às mesmas carteiras que minimizar o risco (raiz da variância),
+    # a escala deixa a função objetivo próxima de 1 para a tolerância do SLSQP
+    escala = max(uns @ matriz_periodo @ uns / n_ativos ** 2, np.finfo(float).tiny)
+
+    def variancia(pesos):
+        return pesos @ matriz_periodo @ pesos / escala
+
+    def gradiente_variancia(pesos):
+        return 2 * matriz_periodo @ pesos / escala
+
+    retornos = np.linspace(retorno_min, retorno_max, numero_pontos)
+    volatilidades = np.empty(numero_pontos)
+    pesos = np.empty((numero_pontos, n_ativos))
+    iteracoes = np.zeros(numero_pontos, dtype=int)
+
+    iteracoes_slsqp = []
+    usar_conjunto_ativo = tuple(limites) == (0, 1)
+    livres = np.ones(n_ativos, dtype=bool)
+    limites = [limites] * n_ativos
+    peso_atual = np.full(n_ativos, 1 / n_ativos) if pesos_iniciais is None else np.asarray(pesos_iniciais, dtype=np.float64)
+    for i, retorno_possivel in enumerate(retornos):
+        retorno_continuo = np.log1p(retorno_possivel) # restrição de retorno escrita na forma contínua (linear)
+
+        solucao = None
+        if usar_conjunto_ativo:
+            solucao = _conjunto_ativo(2 * matriz_periodo, restricoes_lineares, np.array([1.0, retorno_continuo]), livres)
+        if solucao is not None:
+            peso_atual, livres, iteracoes[i] = solucao
+        else:
+            restricoes = ({'type': 'eq', 'fun': lambda w: w.sum() - 1, 'jac': lambda w: uns},
+                          {'type': 'eq', 'fun': lambda w, r=retorno_continuo: w @ media_periodo - r,
+                           'jac': lambda w: media_periodo})
+            resultado = minimize(variancia, peso_atual, jac=gradiente_variancia, method='SLSQP',
+                                 bounds=limites, constraints=restricoes)
+            iteracoes[i] = resultado.nit
+            iteracoes_slsqp.append(resultado.nit)
+            if resultado.success:
+                peso_atual = resultado.x # ponto de partida do próximo retorno
+                livres = resultado.x > 1e-9
+            else:
+                pesos[i] = resultado.x
+                volatilidades[i] = np.sqrt(max(resultado.fun * escala, 0))
+                continue
+
+        pesos[i] = peso_atual
+        volatilidades[i] = np.sqrt(max(peso_atual @ matriz_periodo @ peso_atual, 0))
+
+    evento('fronteira', pontos=numero_pontos, ativos=n_ativos, iteracoes=int(iteracoes.sum()),
+           pontos_slsqp=len(iteracoes_slsqp), iteracoes_slsqp=int(sum(iteracoes_slsqp)))
+    return FronteiraEficiente(retornos=retornos, volatilidades=volatilidades, pesos=pesos, iteracoes=iteracoes)
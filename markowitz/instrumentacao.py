@@ -0,0 +1,121 @@
+# ---------------- Instrumentação ---------------- #
+# tempo, número de chamadas e pico de memória de cada etapa, além de eventos (ex.: latência de download por ticker)
+import contextvars
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+logger = logging.getLogger('markowitz')
+_instrumentacao_atual = contextvars.ContextVar('instrumentacao_atual', default=None)
+# o tracemalloc vale para o processo inteiro e 'etapa' zera o seu pico, então só uma instrumentação por vez mede memória
+_trava_memoria = threading.Lock()
+
+
+class Instrumentacao:
+    '''Coleta as medições das etapas executadas enquanto estiver ativa. Cada rerun do Streamlit roda em seu
+    próprio contexto, então sessões diferentes não se misturam. Sem instrumentação ativa, 'etapa' e 'evento'
+    não fazem nada. Como o pico do tracemalloc é global, a memória é medida por uma instrumentação de cada vez:
+    enquanto outra sessão mede memória, esta mede só o tempo (e registra o evento 'memoria_indisponivel').'''
+
+    def __init__(self, medir_memoria=False):
+        self.medir_memoria = medir_memoria
+        self.etapas = {}
+        self.eventos = []
+        self._pilha = [] # etapas abertas, para propagar o pico de memória das etapas internas
+        self._token = None
+        self._iniciou_tracemalloc = False
+        self._com_trava = False
+
+    def ativar(self):
+        self._token = _instrumentacao_atual.set(self)
+        if self.medir_memoria:
+            self._com_trava = _trava_memoria.acquire(blocking=False)
+            if not self._com_trava:
+                self.medir_memoria = False
+                self.registrar_evento('memoria_indisponivel', motivo='outra sessão está medindo memória')
+            elif not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._iniciou_tracemalloc = True
+        return self
+
+    def desativar(self):
+        if self._token is not None:
+            _instrumentacao_atual.reset(self._token)
+            self._token = None
+        if self._iniciou_tracemalloc:
+            tracemalloc.stop()
+            self._iniciou_tracemalloc = False
+        if self._com_trava:
+            _trava_memoria.release()
+            self._com_trava = False
+
+    def __enter__(self):
+        return self.ativar()
+
+    def __exit__(self, *erro):
+        self.desativar()
+
+    def registrar_etapa(self, nome, segundos, pico_memoria=None):
+        etapa = self.etapas.setdefault(nome, {'etapa': nome, 'chamadas': 0, 'segundos': 0.0, 'segundos_max': 0.0,
+                                              'pico_memoria_mb': None})
+        etapa['chamadas'] += 1
+        etapa['segundos'] += segundos
+        etapa['segundos_max'] = max(etapa['segundos_max'], segundos)
+        if pico_memoria is not None:
+            etapa['pico_memoria_mb'] = max(etapa['pico_memoria_mb'] or 0.0, pico_memoria / 2 ** 20)
+        logger.info(json.dumps({'tipo': 'etapa', 'etapa': nome, 'segundos': segundos,
+                                'pico_memoria_mb': None if pico_memoria is None else pico_memoria / 2 ** 20}))
+
+    def registrar_evento(self, nome, **dados):
+        registro = {'evento': nome, **dados}
+        self.eventos.append(registro)
+        logger.info(json.dumps({'tipo': 'evento', **registro}, ensure_ascii=False, default=str))
+
+    def resumo(self): # etapas ordenadas pelo tempo total
+        return sorted(self.etapas.values(), key=lambda etapa: etapa['segundos'], reverse=True)
+
+    def exportar_json(self):
+        return json.dumps({'etapas': self.resumo(), 'eventos': self.eventos}, ensure_ascii=False, indent=2, default=str)
+
+
+def instrumentacao_atual():
+    return _instrumentacao_atual.get()
+
+
+@contextmanager
+def etapa(nome):
+    '''Mede o tempo (e o pico de memória, se ativado) do bloco de código como a etapa 'nome'.'''
+    instrumentacao = _instrumentacao_atual.get()
+    if instrumentacao is None:
+        yield
+        return
+    medir_memoria = instrumentacao.medir_memoria and tracemalloc.is_tracing()
+    if medir_memoria:
+        memoria_inicial = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    quadro = {'pico': 0}
+    instrumentacao._pilha.append(quadro)
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        instrumentacao._pilha.pop()
+        pico = None
+        if medir_memoria:
+            pico_absoluto = max(tracemalloc.get_traced_memory()[1], quadro['pico'])
+            pico = max(pico_absoluto - memoria_inicial, 0)
+            if instrumentacao._pilha: # a etapa externa também passou por esse pico
+                instrumentacao._pilha[-1]['pico'] = max(instrumentacao._pilha[-1]['pico'], pico_absoluto)
+        instrumentacao.registrar_etapa(nome, segundos, pico)
+
+
+def evento(nome, **dados):
+    '''Registra um evento (ex.: latência de um ticker, iterações do SLSQP) na instrumentação ativa.'''
+    instrumentacao = _instrumentacao_atual.get()
+    if instrumentacao is not None:
+        instrumentacao.registrar_evento(nome, **dados)
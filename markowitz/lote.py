@@ -0,0 +1,85 @@
+# ---------------- Execução em lote ---------------- #
+'''Calcula carteiras para vários conjuntos de ações em paralelo, sem o Streamlit.
+
+Uso:
+    python -m markowitz.lote tarefas.json --saida resultados.json --processos 8
+
+O arquivo de tarefas é uma lista JSON (ou um JSON por linha) com os campos:
+    tickers, data_inicial, data_final, peridiocidade ('Diário', 'Mensal' ou 'Anual'),
+    numero_portfolios e, opcionalmente, nome, numero_pontos, semente e encolhimento (Ledoit-Wolf).
+'''
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from markowitz.cache_precos import DIRETORIO_PADRAO, CachePrecos
+from markowitz.fronteira import NUMERO_PONTOS_PADRAO
+from markowitz.instrumentacao import logger
+from markowitz.motor import calcular_carteiras
+
+
+def ler_tarefas(caminho):
+    with open(caminho, encoding='utf-8') as arquivo:
+        conteudo = arquivo.read().strip()
+    if conteudo.startswith('['):
+        return json.loads(conteudo)
+    return [json.loads(linha) for linha in conteudo.splitlines() if linha.strip()]
+
+
+def agrupar_por_periodo(tarefas):
+    '''União dos tickers das tarefas com as mesmas datas: {(data_inicial, data_final): [tickers]}.'''
+    grupos = {}
+    for tarefa in tarefas:
+        periodo = (pd.Timestamp(tarefa['data_inicial']), pd.Timestamp(tarefa['data_final']))
+        grupos.setdefault(periodo, {}).update(dict.fromkeys(tarefa['tickers']))
+    return {periodo: list(tickers) for periodo, tickers in grupos.items()}
+
+
+def executar_tarefa(tarefa, diretorio_cache=DIRETORIO_PADRAO, offline=False):
+    '''Executa uma tarefa e retorna o resumo das carteiras, ou o erro ocorrido.'''
+    nome = tarefa.get('nome', ','.join(tarefa['tickers']))
+    try:
+        resultado = calcular_carteiras(tarefa['tickers'], tarefa['data_inicial'], tarefa['data_final'],
+                                       tarefa.get('peridiocidade', 'Diário'), int(tarefa['numero_portfolios']),
+                                       CachePrecos(diretorio_cache, offline=offline),
+                                       numero_pontos=int(tarefa.get('numero_pontos', NUMERO_PONTOS_PADRAO)),
+                                       semente=tarefa.get('semente'),
+                                       encolhimento=bool(tarefa.get('encolhimento', False)))
+    except Exception as erro:
+        return {'nome': nome, 'erro': f'{type(erro).__name__}: {erro}'}
+    return {'nome': nome, **resultado.resumo()}
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description='Carteiras de Markowitz em lote')
+    parser.add_argument('tarefas', help='arquivo JSON com as tarefas')
+    parser.add_argument('--saida', default='resultados.json', help='arquivo JSON de saída')
+    parser.add_argument('--processos', type=int, default=os.cpu_count(), help='número de processos')
+    parser.add_argument('--cache', default=DIRETORIO_PADRAO, help='diretório do cache de preços')
+    parser.add_argument('--offline', action='store_true', help='usa apenas preços já em cache')
+    args = parser.parse_args(argumentos)
+
+    tarefas = ler_tarefas(args.tarefas)
+    # o cache é preenchido antes, pelo processo principal, para que os processos não gravem o mesmo arquivo ao mesmo
+    # tempo; tarefas com as mesmas datas são baixadas juntas (união dos tickers), em uma chamada ao download concorrente
+    if not args.offline:
+        cache_precos = CachePrecos(args.cache)
+        for (data_inicial, data_final), tickers in agrupar_por_periodo(tarefas).items():
+            _, erros = cache_precos.precos_lote(tickers, data_inicial, data_final)
+            for ticker, erro in erros.items():
+                logger.warning('Erro ao baixar %s: %s', ticker, erro)
+
+    with ProcessPoolExecutor(max_workers=args.processos) as executor:
+        resultados = list(executor.map(executar_tarefa, tarefas, [args.cache] * len(tarefas), [True] * len(tarefas)))
+
+    with open(args.saida, 'w', encoding='utf-8') as arquivo:
+        json.dump(resultados, arquivo, ensure_ascii=False, indent=2)
+    erros = sum('erro' in resultado for resultado in resultados)
+    print(f'{len(resultados) - erros} tarefa(s) concluída(s), {erros} com erro -> {args.saida}')
+
+
+if __name__ == '__main__':
+    main()
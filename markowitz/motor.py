@@ -0,0 +1,91 @@
+# ---------------- Motor da carteira ---------------- #
+# todo o cálculo de 'app_streamlit.py' sem dependência do Streamlit, usado também por 'markowitz/lote.py'
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from markowitz.covariancia import EstimativaCovariancia, estimar_covariancia
+from markowitz.dados_referencia import taxa_livre_risco
+from markowitz.fronteira import NUMERO_PONTOS_PADRAO, FronteiraEficiente, fronteira_eficiente
+from markowitz.instrumentacao import etapa, evento, logger
+from markowitz.painel_precos import montar_painel
+from markowitz.simulacao import ResultadoSimulacao, simular_carteiras
+
+
+FATORES_PERIODICIDADE = {'Diário': 252, 'Mensal': 12, 'Anual': 1}
+
+
+@dataclass
+class ResultadoCarteiras:
+    tickers: list
+    ret_livre: float
+    estimativa: EstimativaCovariancia
+    simulacao: ResultadoSimulacao
+    fronteira: FronteiraEficiente
+
+    def resumo(self): # dicionário serializável com as carteiras ótima e de mínima variância e a fronteira
+        simulacao = self.simulacao
+        def carteira(indice, pesos):
+            return {'pesos': dict(zip(self.tickers, np.asarray(pesos).round(6).tolist())),
+                    'retorno': float(simulacao.retornos_aritm[indice]),
+                    'risco': float(simulacao.volatilidades[indice]),
+                    'sharpe': float(simulacao.sharpe[indice])}
+        return {'tickers': list(self.tickers),
+                'ret_livre': float(self.ret_livre),
+                'encolhimento': self.estimativa.encolhimento,
+                'carteira_otima': carteira(simulacao.indice_sharpe_max, simulacao.carteira_max_sharpe),
+                'carteira_min_variancia': carteira(simulacao.indice_menor_risco, simulacao.carteira_min_variancia),
+                'fronteira': {'retornos': self.fronteira.retornos.tolist(),
+                              'riscos': self.fronteira.volatilidades.tolist()}}
+
+
+@etapa('precos')
+def baixar_precos(tickers, data_i, data_f, peridiocidade, cache_precos, float32=False):
+    '''Painel de preços (uma coluna por ticker) na periodicidade escolhida, com os preços obtidos em lote por
+    'cache_precos.precos_lote'. Tickers com erro no download ficam de fora, com o erro em 'painel.erros'.'''
+    series, erros = cache_precos.precos_lote(tickers, data_i, data_f)
+    for i, erro in erros.items():
+        logger.warning('Erro ao baixar %s: %s', i, erro)
+        evento('precos_ticker', ticker=i, erro=str(erro))
+    painel = montar_painel([series[i].rename(i) for i in tickers if i in series], peridiocidade, float32)
+    painel.erros = erros
+    return painel
+
+
+@etapa('estatisticas')
+def estatisticas_retornos(painel):
+    '''Retornos contínuos, média dos retornos e matriz de correlação de cada ação.'''
+    retorno_contiuo = painel.retornos
+    media_retor = retorno_contiuo.mean(axis=0)
+    matriz_corr = retorno_contiuo.corr()
+    return retorno_contiuo, media_retor, matriz_corr
+
+
+def otimizar_carteiras(retorno_contiuo, ret_livre, peridiocidade, numero_portfolios, numero_pontos=NUMERO_PONTOS_PADRAO,
+                       semente=None, encolhimento=False):
+    '''Estima a covariância uma única vez e a reutiliza na simulação de Monte Carlo e na fronteira eficiente.'''
+    estimativa = estimar_covariancia(retorno_contiuo, FATORES_PERIODICIDADE[peridiocidade], encolhimento)
+    return otimizar_com_estimativa(estimativa, ret_livre, numero_portfolios, numero_pontos, semente)
+
+
+def otimizar_com_estimativa(estimativa, ret_livre, numero_portfolios, numero_pontos=NUMERO_PONTOS_PADRAO, semente=None):
+    '''Simulação de Monte Carlo e fronteira eficiente a partir de uma estimativa de covariância já calculada.'''
+    simulacao = simular_carteiras(estimativa.media, estimativa.covariancia, ret_livre, numero_portfolios,
+                                  semente=semente, cholesky=estimativa.cholesky)
+    fronteira = fronteira_eficiente(estimativa.media, estimativa.covariancia, simulacao.retornos_aritm.min(),
+                                    simulacao.retornos_aritm.max(), numero_pontos)
+    return ResultadoCarteiras(tickers=estimativa.tickers, ret_livre=ret_livre, estimativa=estimativa,
+                              simulacao=simulacao, fronteira=fronteira)
+
+
+def calcular_carteiras(tickers, data_i, data_f, peridiocidade, numero_portfolios, cache_precos,
+                       numero_pontos=NUMERO_PONTOS_PADRAO, semente=None, encolhimento=False):
+    '''Executa o pipeline completo: download, normalização, estatísticas, simulação e fronteira.'''
+    data_i, data_f = pd.Timestamp(data_i), pd.Timestamp(data_f)
+    painel = baixar_precos(tickers, data_i, data_f, peridiocidade, cache_precos)
+    if len(painel.tickers) < 2:
+        raise ValueError('São necessários no mínimo 2 ativos com preços para compor uma carteira')
+    retorno_contiuo, _, _ = estatisticas_retornos(painel)
+    return otimizar_carteiras(retorno_contiuo, taxa_livre_risco(data_i, data_f), peridiocidade,
+                              numero_portfolios, numero_pontos, semente, encolhimento)
@@ -0,0 +1,48 @@
+# ---------------- Agregação da nuvem de carteiras ---------------- #
+# resume a simulação em um tamanho fixo, independente do número de carteiras, para os gráficos
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class GradeDensidade:
+    riscos: np.ndarray  # centro de cada coluna da grade (eixo x)
+    retornos: np.ndarray  # centro de cada linha da grade (eixo y)
+    contagem: np.ndarray  # número de carteiras em cada célula, formato (linhas, colunas)
+    sharpe: np.ndarray  # Sharpe máximo ou médio de cada célula (NaN nas células vazias)
+
+
+def grade_densidade(volatilidades, retornos, sharpe, celulas=(150, 150), estatistica='max'):
+    '''Agrupa as carteiras em uma grade de risco x retorno, com o Sharpe máximo ('max') ou médio ('media') de cada célula.'''
+    validos = np.isfinite(volatilidades) & np.isfinite(retornos) & np.isfinite(sharpe)
+    volatilidades, retornos, sharpe = volatilidades[validos], retornos[validos], sharpe[validos]
+    n_colunas, n_linhas = celulas
+    bordas_x = np.linspace(volatilidades.min(), volatilidades.max(), n_colunas + 1)
+    bordas_y = np.linspace(retornos.min(), retornos.max(), n_linhas + 1)
+    coluna = np.clip(np.searchsorted(bordas_x, volatilidades, side='right') - 1, 0, n_colunas - 1)
+    linha = np.clip(np.searchsorted(bordas_y, retornos, side='right') - 1, 0, n_linhas - 1)
+    celula = linha * n_colunas + coluna
+
+    contagem = np.bincount(celula, minlength=n_linhas * n_colunas)
+    if estatistica == 'max':
+        valor = np.full(n_linhas * n_colunas, -np.inf)
+        np.maximum.at(valor, celula, sharpe)
+    else:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            valor = np.bincount(celula, weights=sharpe, minlength=n_linhas * n_colunas) / contagem
+    valor[contagem == 0] = np.nan
+    return GradeDensidade(riscos=(bordas_x[:-1] + bordas_x[1:]) / 2, retornos=(bordas_y[:-1] + bordas_y[1:]) / 2,
+                          contagem=contagem.reshape(n_linhas, n_colunas), sharpe=valor.reshape(n_linhas, n_colunas))
+
+
+def indices_pareto(volatilidades, retornos, max_pontos=2000):
+    '''Índices das carteiras não dominadas (nenhuma outra tem menor risco e maior retorno), em ordem de risco.
+    Se houver mais de 'max_pontos', mantém pontos espaçados igualmente.'''
+    ordem = np.lexsort((-retornos, volatilidades)) # risco crescente, e maior retorno primeiro nos empates
+    retornos_ordenados = retornos[ordem]
+    maximo_anterior = np.concatenate([[-np.inf], np.maximum.accumulate(retornos_ordenados)[:-1]])
+    pareto = ordem[retornos_ordenados > maximo_anterior]
+    if pareto.size > max_pontos:
+        pareto = pareto[np.linspace(0, pareto.size - 1, max_pontos).astype(int)]
+    return pareto
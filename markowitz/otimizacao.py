@@ -0,0 +1,161 @@
+# ---------------- Otimização das carteiras ---------------- #
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+from scipy.optimize import minimize
+
+from markowitz.fronteira import _conjunto_ativo
+from markowitz.instrumentacao import etapa, evento
+
+
+PARTIDAS_PADRAO = 4  # pontos de partida do SLSQP quando o conjunto ativo não se aplica
+
+
+@dataclass
+class CarteirasExatas:
+    max_sharpe: np.ndarray  # pesos da carteira ótima
+    min_variancia: np.ndarray  # pesos da carteira de mínima variância
+    retornos: np.ndarray  # retornos contínuos das carteiras [ótima, mínima variância], como em 'simular_carteiras'
+    retornos_aritm: np.ndarray
+    volatilidades: np.ndarray
+    sharpe: np.ndarray
+
+
+def tetos_por_grupo(tickers, grupo_ticker, teto):
+    '''Restrições de peso máximo 'teto' para a soma dos pesos de cada grupo (ex.: subsetor) de 'tickers',
+    no formato [(índices, teto), ...] aceito pelas funções de otimização.'''
+    grupos = {}
+    for indice, ticker in enumerate(tickers):
+        if ticker in grupo_ticker:
+            grupos.setdefault(grupo_ticker[ticker], []).append(indice)
+    return [(np.array(indices), teto) for indices in grupos.values()]
+
+
+def _limites_ativos(n_ativos, limites): # (min, max) único ou um par por ação -> matriz n_ativos x 2
+    limites = np.asarray(limites, dtype=np.float64)
+    return np.tile(limites, (n_ativos, 1)) if limites.ndim == 1 else limites
+
+
+def _sem_restricoes_extras(limites, tetos_grupos): # só os limites (0,1): vale o método do conjunto ativo
+    return not tetos_grupos and np.all(limites == (0, 1))
+
+
+def _restricoes_e_limites(n_ativos, limites, tetos_grupos=None):
+    uns = np.ones(n_ativos)
+    restricoes = [{'type': 'eq', 'fun': lambda w: w.sum() - 1, 'jac': lambda w: uns}] # soma dos pesos igual a 1 (100%)
+    maximo_possivel = limites[:, 1].copy() # maior soma de pesos permitida pelos tetos, para checar a viabilidade
+    for indices, teto in tetos_grupos or ():
+        mascara = np.zeros(n_ativos)
+        mascara[indices] = 1
+        restricoes.append({'type': 'ineq', 'fun': lambda w, m=mascara, t=teto: t - m @ w, 'jac': lambda w, m=mascara: -m})
+        excesso = maximo_possivel[indices].sum() - teto
+        if excesso > 0:
+            maximo_possivel[indices] *= teto / maximo_possivel[indices].sum()
+    if maximo_possivel.sum() < 1 - 1e-9 or limites[:, 0].sum() > 1 + 1e-9:
+        raise ValueError('Limites de peso inviáveis: os pesos não conseguem somar 100%')
+    return restricoes, [tuple(i) for i in limites]
+
+
+def _pesos_iniciais(n_ativos, pesos_iniciais):
+    if pesos_iniciais is None or len(pesos_iniciais) != n_ativos:
+        return np.full(n_ativos, 1 / n_ativos) # pesos iguais para todas as acoes
+    return np.asarray(pesos_iniciais, dtype=np.float64)
+
+
+def _partidas(n_ativos, pesos_iniciais, partidas, semente):
+    # a primeira partida é a solução anterior (ou pesos iguais); as demais são sorteadas no simplex
+    gerador = np.random.default_rng(semente)
+    return [_pesos_iniciais(n_ativos, pesos_iniciais)] + list(gerador.dirichlet(np.ones(n_ativos), partidas - 1))
+
+
+def carteira_min_variancia(covariancia, pesos_iniciais=None, limites=(0, 1), tetos_grupos=None):
+    '''Pesos da carteira de mínima variância. Com os limites (0,1) e sem tetos a solução é exata, pelo método do
+    conjunto ativo; nos demais casos usa o SLSQP com gradiente analítico (o problema é convexo, então o ótimo
+    encontrado é o global). 'pesos_iniciais' permite partir de uma solução anterior.'''
+    covariancia = np.ascontiguousarray(covariancia, dtype=np.float64)
+    n_ativos = covariancia.shape[0]
+    limites = _limites_ativos(n_ativos, limites)
+    if _sem_restricoes_extras(limites, tetos_grupos):
+        livres = np.ones(n_ativos, dtype=bool) if pesos_iniciais is None else np.asarray(pesos_iniciais) > 1e-9
+        solucao = _conjunto_ativo(2 * covariancia, np.ones((1, n_ativos)), np.array([1.0]), livres)
+        if solucao is not None:
+            evento('conjunto_ativo', carteira='minima_variancia', iteracoes=solucao[2])
+            return solucao[0]
+
+    escala = max(np.trace(covariancia) / n_ativos, np.finfo(float).tiny) # deixa a função objetivo próxima de 1
+    restricoes, limites = _restricoes_e_limites(n_ativos, limites, tetos_grupos)
+    resultado = minimize(lambda w: w @ covariancia @ w / escala, _pesos_iniciais(n_ativos, pesos_iniciais),
+                         jac=lambda w: 2 * covariancia @ w / escala, method='SLSQP',
+                         bounds=limites, constraints=restricoes)
+    evento('slsqp', carteira='minima_variancia', iteracoes=int(resultado.nit), sucesso=bool(resultado.success))
+    return resultado.x
+
+
+def carteira_max_sharpe(media_retor, covariancia, ret_livre, pesos_iniciais=None, limites=(0, 1), tetos_grupos=None,
+                        partidas=1, semente=None):
+    '''Pesos da carteira de maior Índice de Sharpe. 'media_retor' e 'covariancia' já devem estar anualizadas.
+    Com os limites (0,1), sem tetos e alguma ação acima da taxa livre de risco, a solução é exata: com y = w / w'(mu - rf),
+    o problema vira min y'My com y'(mu - rf) = 1 e y >= 0, resolvido pelo método do conjunto ativo. Nos demais casos
+    usa o SLSQP com gradiente analítico a partir de 'partidas' pontos, em paralelo, e fica com a melhor solução.'''
+    media_retor = np.asarray(media_retor, dtype=np.float64)
+    covariancia = np.ascontiguousarray(covariancia, dtype=np.float64)
+    n_ativos = media_retor.shape[0]
+    excesso = media_retor - ret_livre # com soma dos pesos igual a 1, w'(mu - rf) = w'mu - rf
+    limites = _limites_ativos(n_ativos, limites)
+
+    if _sem_restricoes_extras(limites, tetos_grupos) and excesso.max() > 0:
+        livres = excesso > 0 if pesos_iniciais is None else (np.asarray(pesos_iniciais) > 1e-9) & (excesso > 0)
+        if not livres.any():
+            livres = excesso > 0
+        solucao = _conjunto_ativo(2 * covariancia, excesso[None, :], np.array([1.0]), livres)
+        if solucao is not None and solucao[0].sum() > 0:
+            evento('conjunto_ativo', carteira='max_sharpe', iteracoes=solucao[2])
+            return solucao[0] / solucao[0].sum()
+
+    def sharpe_negativo(pesos):
+        risco = np.sqrt(pesos @ covariancia @ pesos)
+        return -(pesos @ excesso) / risco
+
+    def gradiente(pesos):
+        variancia = pesos @ covariancia @ pesos
+        risco = np.sqrt(variancia)
+        return -(excesso * risco - (pesos @ excesso) * (covariancia @ pesos) / risco) / variancia
+
+    restricoes, limites = _restricoes_e_limites(n_ativos, limites, tetos_grupos)
+
+    def resolver(inicio):
+        return minimize(sharpe_negativo, inicio, jac=gradiente, method='SLSQP', bounds=limites, constraints=restricoes)
+
+    inicios = _partidas(n_ativos, pesos_iniciais, max(partidas, 1), semente)
+    if len(inicios) > 1: # o SLSQP roda em Fortran/NumPy e as partidas são independentes entre si
+        with ThreadPoolExecutor(max_workers=min(len(inicios), os.cpu_count() or 1)) as executor:
+            resultados = list(executor.map(resolver, inicios))
+    else:
+        resultados = [resolver(inicios[0])]
+    viaveis = [i for i in resultados if i.success] or resultados
+    resultado = min(viaveis, key=lambda i: i.fun)
+    evento('slsqp', carteira='max_sharpe', iteracoes=int(sum(i.nit for i in resultados)), partidas=len(resultados),
+           sucesso=bool(resultado.success))
+    return resultado.x
+
+
+@etapa('otimizacao_exata')
+def carteiras_exatas(media_retor, covariancia, ret_livre, limites=(0, 1), tetos_grupos=None, partidas=PARTIDAS_PADRAO,
+                     semente=0):
+    '''Carteira ótima (maior Índice de Sharpe) e de mínima variância calculadas diretamente, sem depender do número
+    de carteiras simuladas. 'media_retor' e 'covariancia' já devem estar anualizadas.'''
+    media_retor = np.asarray(media_retor, dtype=np.float64)
+    covariancia = np.ascontiguousarray(covariancia, dtype=np.float64)
+    min_variancia = carteira_min_variancia(covariancia, limites=limites, tetos_grupos=tetos_grupos)
+    max_sharpe = carteira_max_sharpe(media_retor, covariancia, ret_livre, pesos_iniciais=min_variancia, limites=limites,
+                                     tetos_grupos=tetos_grupos, partidas=partidas, semente=semente)
+    pesos = np.vstack([max_sharpe, min_variancia])
+    retornos = pesos @ media_retor
+    # com covariância de posto incompleto (poucas observações) o arredondamento pode deixar a variância negativa
+    volatilidades = np.sqrt(np.maximum(np.einsum('ij,jk,ik->i', pesos, covariancia, pesos), 0))
+    with np.errstate(divide='ignore', invalid='ignore'): # risco zero: Sharpe infinito, como na simulação
+        sharpe = (retornos - ret_livre) / volatilidades
+    return CarteirasExatas(max_sharpe=max_sharpe, min_variancia=min_variancia, retornos=retornos,
+                           retornos_aritm=np.expm1(retornos), volatilidades=volatilidades, sharpe=sharpe)
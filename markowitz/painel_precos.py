@@ -0,0 +1,51 @@
+# ---------------- Painel de preços ---------------- #
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from markowitz.instrumentacao import etapa
+
+
+REGRAS_RESAMPLE = {'Mensal': 'ME', 'Anual': 'YE'}
+
+
+@dataclass
+class PainelPrecos:
+    precos: pd.DataFrame  # uma coluna por ação (sem '.SA'), datas alinhadas
+    normalizados: pd.DataFrame  # preços divididos pelo primeiro preço válido de cada ação
+    retornos: pd.DataFrame  # retornos contínuos ln(Preço t / Preço t-1), sem a primeira data
+    erros: dict = field(default_factory=dict)  # tickers que ficaram de fora -> erro do download
+
+    @property
+    def tickers(self):
+        return list(self.precos.columns)
+
+
+@etapa('painel')
+def montar_painel(series_precos, peridiocidade, float32=False):
+    '''Alinha as séries de preços em uma única tabela e calcula, sobre a matriz inteira e sem arredondamentos,
+    a periodicidade, a normalização pelo primeiro preço válido e os retornos contínuos.
+    Com 'float32' os valores ocupam metade da memória.'''
+    series_precos = list(series_precos)
+    if not series_precos:
+        vazio = pd.DataFrame(index=pd.DatetimeIndex([]))
+        return PainelPrecos(precos=vazio, normalizados=vazio, retornos=vazio)
+
+    precos = pd.concat(series_precos, axis=1, sort=True)
+    precos.columns = [str(i)[:5] for i in precos.columns] # ignora o '.SA'
+    precos = precos.astype(np.float32 if float32 else np.float64)
+    if peridiocidade in REGRAS_RESAMPLE:
+        precos = precos.resample(REGRAS_RESAMPLE[peridiocidade]).last()
+
+    valores = precos.to_numpy()
+    validos = ~np.isnan(valores)
+    # primeiro preço válido de cada coluna (colunas sem nenhum preço ficam com NaN)
+    primeira_linha = validos.argmax(axis=0)
+    primeiros = np.where(validos.any(axis=0), valores[primeira_linha, np.arange(valores.shape[1])], np.nan)
+    normalizados = pd.DataFrame(valores / primeiros, index=precos.index, columns=precos.columns)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logaritmos = np.log(valores)
+    retornos = pd.DataFrame(logaritmos[1:] - logaritmos[:-1], index=precos.index[1:], columns=precos.columns)
+    return PainelPrecos(precos=precos, normalizados=normalizados, retornos=retornos)
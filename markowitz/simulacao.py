@@ -0,0 +1,78 @@
+# ---------------- Simulação de Monte Carlo ---------------- #
+from dataclasses import dataclass
+
+import numpy as np
+
+from markowitz.instrumentacao import etapa
+
+
+TAMANHO_LOTE_PADRAO = 100_000  # número de carteiras simuladas por lote (limita o pico de memória)
+
+
+@dataclass
+class ResultadoSimulacao:
+    retornos: np.ndarray  # retorno esperado (contínuo) de cada carteira
+    retornos_aritm: np.ndarray  # retorno esperado aritmético de cada carteira
+    volatilidades: np.ndarray  # risco esperado de cada carteira
+    sharpe: np.ndarray  # índice de Sharpe de cada carteira
+    indice_sharpe_max: int  # posição da carteira ótima
+    indice_menor_risco: int  # posição da carteira de mínima variância
+    carteira_max_sharpe: np.ndarray  # pesos da carteira ótima
+    carteira_min_variancia: np.ndarray  # pesos da carteira de mínima variância
+    pesos: np.ndarray = None  # pesos de todas as carteiras, apenas se 'guardar_pesos=True'
+
+
+@etapa('simulacao')
+def simular_carteiras(media_retor, covariancia, ret_livre, numero_portfolios, tamanho_lote=TAMANHO_LOTE_PADRAO,
+                      semente=None, guardar_pesos=False, cholesky=None):
+    '''Simula 'numero_portfolios' carteiras com pesos aleatórios, calculando retorno, risco e
+    índice de Sharpe de um lote inteiro de carteiras por vez. 'media_retor' e 'covariancia' já devem
+    estar anualizadas; com o fator de Cholesky (covariancia = L @ L.T) o risco é a norma de w @ L.'''
+    media_periodo = np.ascontiguousarray(media_retor, dtype=np.float64)
+    matriz_risco = np.ascontiguousarray(covariancia if cholesky is None else cholesky, dtype=np.float64)
+    n_ativos = media_periodo.shape[0]
+    gerador = np.random.default_rng(semente)
+    tamanho_lote = max(1, int(tamanho_lote))
+
+    retornos = np.empty(numero_portfolios)
+    volatilidades = np.empty(numero_portfolios)
+    pesos = np.empty((numero_portfolios, n_ativos)) if guardar_pesos else None
+
+    # melhores carteiras encontradas até o lote atual
+    sharpe_max, indice_sharpe_max, carteira_max_sharpe = -np.inf, 0, None
+    vol_min, indice_menor_risco, carteira_min_variancia = np.inf, 0, None
+
+    for inicio in range(0, numero_portfolios, tamanho_lote):
+        fim = min(inicio + tamanho_lote, numero_portfolios)
+        pesos_lote = gerador.random((fim - inicio, n_ativos))  # aleatoriedade
+        pesos_lote /= pesos_lote.sum(axis=1, keepdims=True)
+
+        retornos_lote = pesos_lote @ media_periodo
+        # forma quadrática w' * M * w (ou |w @ L|^2) para todas as carteiras do lote de uma vez
+        if cholesky is None:
+            vol_lote = np.sqrt(np.einsum('ij,ij->i', pesos_lote @ matriz_risco, pesos_lote))
+        else:
+            fatorado = pesos_lote @ matriz_risco
+            vol_lote = np.sqrt(np.einsum('ij,ij->i', fatorado, fatorado))
+        sharpe_lote = (retornos_lote - ret_livre) / vol_lote
+
+        retornos[inicio:fim] = retornos_lote
+        volatilidades[inicio:fim] = vol_lote
+        if guardar_pesos:
+            pesos[inicio:fim] = pesos_lote
+
+        i_sharpe = int(np.nanargmax(sharpe_lote)) if not np.isnan(sharpe_lote).all() else 0
+        if carteira_max_sharpe is None or sharpe_lote[i_sharpe] > sharpe_max:
+            sharpe_max, indice_sharpe_max = sharpe_lote[i_sharpe], inicio + i_sharpe
+            carteira_max_sharpe = pesos_lote[i_sharpe].copy()
+
+        i_vol = int(np.argmin(vol_lote))
+        if carteira_min_variancia is None or vol_lote[i_vol] < vol_min:
+            vol_min, indice_menor_risco = vol_lote[i_vol], inicio + i_vol
+            carteira_min_variancia = pesos_lote[i_vol].copy()
+
+    sharpe = (retornos - ret_livre) / volatilidades  # formula do IS
+    return ResultadoSimulacao(retornos=retornos, retornos_aritm=np.expm1(retornos), volatilidades=volatilidades,
+                              sharpe=sharpe, indice_sharpe_max=indice_sharpe_max,
+                              indice_menor_risco=indice_menor_risco, carteira_max_sharpe=carteira_max_sharpe,
+                              carteira_min_variancia=carteira_min_variancia, pesos=pesos)
@@ -0,0 +1,148 @@
+# ---------------- Triagem de correlação do universo ---------------- #
+# correlação entre todas as ações de 'base_acoes.csv' (sem as de 'erro_acao.csv') e sugestão de cestas pouco correlacionadas
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from markowitz.dados_referencia import acoes_por_subsetor
+from markowitz.instrumentacao import etapa
+from markowitz.motor import baixar_precos
+
+
+TAMANHO_BLOCO_PADRAO = 128  # colunas da matriz de retornos processadas por vez
+MINIMO_OBSERVACOES = 30  # pares com menos datas em comum ficam sem correlação (NaN)
+
+
+def tickers_universo(excluir=()):
+    '''Tickers (sem '.SA') de todos os subsetores e o subsetor de cada um, exceto os de 'excluir'.'''
+    excluir = set(excluir)
+    return {codigo: subsetor for subsetor, codigos in acoes_por_subsetor().items() for codigo in codigos
+            if codigo not in excluir}
+
+
+def montar_retornos_universo(cache_precos, data_i, data_f, peridiocidade, diretorio=None, excluir=None):
+    '''Matriz de retornos contínuos (datas x ações, float32) do universo inteiro, gravada em disco e aberta como
+    memória mapeada. Se a matriz dos mesmos parâmetros já existir, é apenas reaberta, sem ler os preços de novo.
+    Ações em 'excluir' (por padrão, as da lista negra do cache de preços) ficam de fora. Se o download de alguma ação
+    falhar, a matriz é retornada sem ser gravada, para que a próxima triagem tente essas ações de novo.'''
+    if excluir is None:
+        lista_negra = getattr(cache_precos, 'lista_negra', None)
+        excluir = lista_negra.codigos() if lista_negra is not None else ()
+    universo = tickers_universo(excluir)
+    diretorio = os.path.join(diretorio or cache_precos.diretorio, 'universo')
+    os.makedirs(diretorio, exist_ok=True)
+    chave = hashlib.sha1(json.dumps([sorted(universo), str(pd.Timestamp(data_i)), str(pd.Timestamp(data_f)),
+                                     peridiocidade]).encode()).hexdigest()[:16]
+    caminho = os.path.join(diretorio, f'{chave}.npy')
+    caminho_tickers = os.path.join(diretorio, f'{chave}.json')
+
+    if not (os.path.exists(caminho) and os.path.exists(caminho_tickers)):
+        painel = baixar_precos([i + '.SA' for i in universo], data_i, data_f, peridiocidade, cache_precos, float32=True)
+        retornos = painel.retornos.loc[:, painel.retornos.notna().sum() >= MINIMO_OBSERVACOES]
+        if _download_incompleto(painel, cache_precos):
+            return retornos.to_numpy(dtype=np.float32), list(retornos.columns)
+        matriz = np.lib.format.open_memmap(caminho + '.tmp', mode='w+', dtype=np.float32, shape=retornos.shape)
+        matriz[:] = retornos.to_numpy(dtype=np.float32)
+        matriz.flush()
+        del matriz
+        os.replace(caminho + '.tmp', caminho)
+        with open(caminho_tickers, 'w', encoding='utf-8') as arquivo:
+            json.dump(list(retornos.columns), arquivo)
+
+    with open(caminho_tickers, encoding='utf-8') as arquivo:
+        tickers = json.load(arquivo)
+    return np.load(caminho, mmap_mode='r'), tickers
+
+
+def _download_incompleto(painel, cache_precos):
+    # falhas de requisição podem ser passageiras, assim como a falta de preços em cache no modo offline; já ações sem
+    # preços no período (ou com poucas observações) ficam de fora de forma definitiva e a matriz pode ser gravada
+    if getattr(cache_precos, 'offline', False):
+        return bool(painel.erros)
+    return any(isinstance(erro, Exception) for erro in painel.erros.values())
+
+
+@etapa('correlacao_universo')
+def correlacao_em_blocos(retornos, tamanho_bloco=TAMANHO_BLOCO_PADRAO, minimo_observacoes=MINIMO_OBSERVACOES):
+    '''Correlação entre todas as colunas de 'retornos' (pode ser memória mapeada), considerando para cada par apenas
+    as datas em que as duas ações têm retorno (com a média de cada ação calculada em todas as suas datas). As colunas
+    são lidas em blocos, então a memória usada depende do tamanho do bloco e não do número de ações.'''
+    n_datas, n_ativos = retornos.shape
+    correlacao = np.full((n_ativos, n_ativos), np.nan, dtype=np.float32)
+
+    def preparar(inicio, fim): # desvios em relação à média de cada coluna, com zero nas datas sem retorno
+        bloco = np.asarray(retornos[:, inicio:fim], dtype=np.float64)
+        validos = ~np.isnan(bloco)
+        with np.errstate(invalid='ignore'):
+            desvios = np.where(validos, bloco - np.nanmean(bloco, axis=0), 0.0)
+        return desvios, validos.astype(np.float64)
+
+    for inicio_a in range(0, n_ativos, tamanho_bloco):
+        fim_a = min(inicio_a + tamanho_bloco, n_ativos)
+        desvios_a, validos_a = preparar(inicio_a, fim_a)
+        for inicio_b in range(inicio_a, n_ativos, tamanho_bloco):
+            fim_b = min(inicio_b + tamanho_bloco, n_ativos)
+            desvios_b, validos_b = (desvios_a, validos_a) if inicio_b == inicio_a else preparar(inicio_b, fim_b)
+            produto = desvios_a.T @ desvios_b
+            soma_quadrados_a = (desvios_a ** 2).T @ validos_b # variância de 'a' nas datas em comum com 'b'
+            soma_quadrados_b = validos_a.T @ (desvios_b ** 2)
+            observacoes = validos_a.T @ validos_b
+            with np.errstate(invalid='ignore', divide='ignore'):
+                bloco = produto / np.sqrt(soma_quadrados_a * soma_quadrados_b)
+            bloco[observacoes < minimo_observacoes] = np.nan
+            correlacao[inicio_a:fim_a, inicio_b:fim_b] = bloco
+            correlacao[inicio_b:fim_b, inicio_a:fim_a] = bloco.T
+    np.fill_diagonal(correlacao, 1.0)
+    return correlacao
+
+
+def cesta_baixa_correlacao(correlacao, tickers, tamanho=5, subsetores=None, max_por_subsetor=None, candidatos=None):
+    '''Seleção gulosa: começa pela ação com menor correlação média com as demais e, a cada passo, inclui a ação
+    com menor correlação média (em módulo) com as já escolhidas. 'max_por_subsetor' limita quantas ações de um
+    mesmo subsetor entram na cesta. Retorna os tickers escolhidos e a correlação média da cesta.'''
+    absoluta = np.abs(np.nan_to_num(np.asarray(correlacao, dtype=np.float64), nan=1.0)) # pares sem dados contam como correlacionados
+    indices = np.arange(len(tickers)) if candidatos is None else np.array([tickers.index(i) for i in candidatos if i in tickers])
+    if indices.size == 0:
+        return [], np.nan
+    submatriz = absoluta[np.ix_(indices, indices)]
+    media_geral = (submatriz.sum(axis=1) - 1) / max(indices.size - 1, 1)
+
+    escolhidos = [int(np.argmin(media_geral))]
+    contagem_subsetor = {}
+    def registrar(posicao):
+        if subsetores is not None:
+            subsetor = subsetores[tickers[indices[posicao]]]
+            contagem_subsetor[subsetor] = contagem_subsetor.get(subsetor, 0) + 1
+    registrar(escolhidos[0])
+
+    soma_correlacao = submatriz[escolhidos[0]].copy()
+    while len(escolhidos) < min(tamanho, indices.size):
+        custo = soma_correlacao / len(escolhidos)
+        custo[escolhidos] = np.inf
+        if subsetores is not None and max_por_subsetor is not None:
+            cheios = [posicao for posicao in range(indices.size)
+                      if contagem_subsetor.get(subsetores[tickers[indices[posicao]]], 0) >= max_por_subsetor]
+            custo[cheios] = np.inf
+        proximo = int(np.argmin(custo))
+        if not np.isfinite(custo[proximo]):
+            break
+        escolhidos.append(proximo)
+        registrar(proximo)
+        soma_correlacao += submatriz[proximo]
+
+    selecionados = indices[escolhidos]
+    bloco = absoluta[np.ix_(selecionados, selecionados)]
+    media_cesta = (bloco.sum() - len(selecionados)) / max(len(selecionados) * (len(selecionados) - 1), 1)
+    return [tickers[i] for i in selecionados], float(media_cesta)
+
+
+def cestas_por_subsetor(correlacao, tickers, subsetores, tamanho=5):
+    '''Uma cesta de baixa correlação dentro de cada subsetor.'''
+    cestas = {}
+    for subsetor in sorted(set(subsetores[i] for i in tickers)):
+        candidatos = [i for i in tickers if subsetores[i] == subsetor]
+        cestas[subsetor] = cesta_baixa_correlacao(correlacao, tickers, tamanho, candidatos=candidatos)
+    return cestas
@@ -0,0 +1,31 @@
+# ---------------- Testes do cache de preços ---------------- #
+'''Testes de 'markowitz/cache_precos.py' com a 'FonteLocal' no lugar do Yahoo Finance.
+
+Uso:
+    python -m pytest tests
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from markowitz.cache_precos import CachePrecos  # noqa: E402
+from markowitz.download import DownloaderConcorrente, FonteLocal  # noqa: E402
+from test_download import tabela_precos  # noqa: E402
+
+
+def test_instancias_no_mesmo_diretorio_preservam_a_cobertura(tmp_path):
+    fonte = FonteLocal(tabela_precos())
+    def criar_cache():
+        return CachePrecos(str(tmp_path), offline=False, downloader=DownloaderConcorrente(fonte, espera_inicial=0.001))
+
+    cache_a, cache_b = criar_cache(), criar_cache()
+    cache_a.precos_lote(['AAAA3.SA', 'BBBB3.SA'], '2020-01-01', '2020-07-01')
+    cache_b.precos_lote(['CCCC3.SA'], '2020-01-01', '2020-07-01')
+    cache_a.precos_lote(['AAAA3.SA'], '2020-01-01', '2020-03-01') # já coberto, sem nova requisição
+
+    requisicoes = fonte.requisicoes
+    precos, erros = criar_cache().precos_lote(['AAAA3.SA', 'BBBB3.SA', 'CCCC3.SA'], '2020-01-01', '2020-07-01')
+    assert not erros and len(precos) == 3
+    assert fonte.requisicoes == requisicoes
+    assert cache_b.cobertura('AAAA3.SA') and cache_a.cobertura('CCCC3.SA')
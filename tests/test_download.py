@@ -0,0 +1,124 @@
+# ---------------- Testes do download concorrente ---------------- #
+'''Testes de 'markowitz/download.py' e do cache de preços com a 'FonteLocal' no lugar do Yahoo Finance.
+
+Uso:
+    python -m pytest tests
+'''
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from markowitz.cache_precos import CachePrecos  # noqa: E402
+from markowitz.cache_resultados import SessaoCalculo  # noqa: E402
+from markowitz.download import DownloaderConcorrente, FonteLocal  # noqa: E402
+from markowitz.instrumentacao import Instrumentacao  # noqa: E402
+
+
+TICKERS = ['AAAA3.SA', 'BBBB3.SA', 'CCCC3.SA']
+
+
+def tabela_precos(tickers=TICKERS, inicio='2019-01-01', fim='2021-12-31'):
+    datas = pd.bdate_range(inicio, fim)
+    gerador = np.random.default_rng(0)
+    return pd.DataFrame(30 * np.exp(np.cumsum(gerador.normal(0, 0.01, (len(datas), len(tickers))), axis=0)),
+                        index=datas, columns=tickers)
+
+
+def criar_cache(diretorio, fonte, **opcoes):
+    return CachePrecos(str(diretorio), offline=False,
+                       downloader=DownloaderConcorrente(fonte, espera_inicial=0.001, **opcoes))
+
+
+def test_novas_tentativas_apos_erro_transitorio(tmp_path):
+    fonte = FonteLocal(tabela_precos(), erros_transitorios=2)
+    cache = criar_cache(tmp_path, fonte, tentativas=3)
+    with Instrumentacao() as instrumentacao:
+        precos, erros = cache.precos_lote(TICKERS, '2020-01-01', '2020-07-01')
+    assert not erros and sorted(precos) == TICKERS
+    assert fonte.requisicoes == 3
+    assert [i['tentativa'] for i in instrumentacao.eventos if i['evento'] == 'download_lote'] == [1, 2, 3]
+    latencias = [i for i in instrumentacao.eventos if i['evento'] == 'download_ticker']
+    assert sorted(i['ticker'] for i in latencias) == TICKERS
+
+
+def test_lotes_em_paralelo(tmp_path):
+    tickers = [f'T{i:03d}3.SA' for i in range(40)]
+    fonte = FonteLocal(tabela_precos(tickers))
+    precos, erros = criar_cache(tmp_path, fonte, tamanho_lote=10).precos_lote(tickers, '2020-01-01', '2020-07-01')
+    assert not erros and len(precos) == 40
+    assert fonte.requisicoes == 4
+    pd.testing.assert_series_equal(precos['T0053.SA'], fonte.precos.loc['2020-01-01':'2020-06-30', 'T0053.SA'],
+                                   check_names=False, check_freq=False, check_index_type=False)
+
+
+def test_falha_de_requisicao_nao_altera_o_cache(tmp_path):
+    fonte = FonteLocal(tabela_precos(), erros_transitorios=10)
+    cache = criar_cache(tmp_path, fonte, tentativas=2)
+    precos, erros = cache.precos_lote(TICKERS, '2020-01-01', '2020-07-01')
+    assert not precos and set(erros) == set(TICKERS)
+    assert all(cache.cobertura(i) == [] for i in TICKERS)
+
+    fonte.erros_transitorios = 0 # a fonte volta: os tickers são baixados normalmente
+    precos, erros = cache.precos_lote(TICKERS, '2020-01-01', '2020-07-01')
+    assert not erros and sorted(precos) == TICKERS
+    assert not cache.lista_negra.tickers()
+
+
+def test_lista_negra_apenas_sem_historico(tmp_path):
+    fonte = FonteLocal(tabela_precos(['AAAA3.SA']))
+    cache = criar_cache(tmp_path, fonte)
+    for _ in range(2):
+        precos, erros = cache.precos_lote(['AAAA3.SA', 'XXXX3.SA'], '2020-01-01', '2020-07-01')
+    assert list(precos) == ['AAAA3.SA']
+    assert erros == {'XXXX3.SA': 'sem preços em todo o histórico'}
+    assert cache.lista_negra.codigos() == {'XXXX3'}
+
+
+def test_periodo_sem_precos_nao_entra_na_lista_negra(tmp_path):
+    # ação listada em 2019 consultada em 2015-2016: o período é informado, mas o ticker não é bloqueado
+    fonte = FonteLocal(tabela_precos(['NOVO3.SA']))
+    cache = criar_cache(tmp_path, fonte)
+    for _ in range(3):
+        precos, erros = cache.precos_lote(['NOVO3.SA'], '2015-01-01', '2016-12-31')
+        assert not precos and erros == {'NOVO3.SA': 'sem preços no período'}
+    assert not cache.lista_negra.tickers()
+
+    requisicoes = fonte.requisicoes # o histórico completo ficou em cache
+    precos, erros = cache.precos_lote(['NOVO3.SA'], '2020-01-01', '2020-07-01')
+    assert not erros and len(precos['NOVO3.SA']) > 0
+    assert fonte.requisicoes == requisicoes
+
+
+def test_download_bem_sucedido_retira_da_lista_negra(tmp_path):
+    fonte = FonteLocal(tabela_precos(), falhas={'CCCC3.SA'})
+    cache = criar_cache(tmp_path, fonte)
+    for _ in range(2):
+        cache.precos_lote(['CCCC3.SA'], '2020-01-01', '2020-07-01')
+    assert cache.lista_negra.codigos() == {'CCCC3'}
+
+    fonte.falhas = set()
+    precos, erros = cache.precos_lote(['CCCC3.SA'], '2020-01-01', '2020-07-01')
+    assert not erros and not cache.lista_negra.tickers()
+
+
+@pytest.mark.parametrize('semente', [0, None])
+def test_sessao_nao_guarda_resultados_de_painel_incompleto(tmp_path, semente):
+    fonte = FonteLocal(tabela_precos(), falhas={'CCCC3.SA'})
+    sessao = SessaoCalculo(criar_cache(tmp_path, fonte))
+    parametros = (TICKERS, '2020-01-01', '2021-01-01', 'Diário')
+
+    painel = sessao.painel(*parametros)
+    requisicoes = fonte.requisicoes
+    resultado = sessao.carteiras_otimas(*parametros, 1000, 0.05, 20, semente, painel=painel)
+    assert len(painel.tickers) == len(resultado.tickers) == 2
+    assert fonte.requisicoes == requisicoes # o painel já lido é reaproveitado
+
+    fonte.falhas = set()
+    painel = sessao.painel(*parametros)
+    resultado = sessao.carteiras_otimas(*parametros, 1000, 0.05, 20, semente, painel=painel)
+    assert len(painel.tickers) == len(resultado.tickers) == 3
@@ -0,0 +1,39 @@
+# ---------------- Testes da triagem do universo ---------------- #
+'''Testes de 'markowitz/triagem.py' com a 'FonteLocal' no lugar do Yahoo Finance.
+
+Uso:
+    python -m pytest tests
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from markowitz.cache_precos import CachePrecos  # noqa: E402
+from markowitz.download import DownloaderConcorrente, FonteLocal  # noqa: E402
+from markowitz.triagem import montar_retornos_universo, tickers_universo  # noqa: E402
+from test_download import tabela_precos  # noqa: E402
+
+
+def test_matriz_do_universo_nao_e_gravada_com_falha_de_download(tmp_path):
+    universo = sorted(tickers_universo())
+    # a primeira requisição (um lote de 25 ações) falha; a última ação só tem preços depois do período
+    precos = tabela_precos([i + '.SA' for i in universo[:-1]], '2020-01-01', '2020-12-31')
+    precos[universo[-1] + '.SA'] = precos.iloc[:, 0].where(precos.index >= '2020-09-01')
+    fonte = FonteLocal(precos, erros_transitorios=1)
+    cache = CachePrecos(str(tmp_path), offline=False,
+                        downloader=DownloaderConcorrente(fonte, tentativas=1, tamanho_lote=25))
+    parametros = (cache, '2020-01-01', '2020-07-01', 'Diário')
+
+    matriz, tickers = montar_retornos_universo(*parametros, excluir=())
+    assert len(tickers) == len(universo) - 26
+    assert not os.listdir(tmp_path / 'universo')
+
+    # a fonte voltou: as ações que falharam entram e a matriz é gravada, mesmo sem a ação listada depois do período
+    matriz, tickers = montar_retornos_universo(*parametros, excluir=())
+    assert sorted(tickers) == universo[:-1] and matriz.shape[1] == len(universo) - 1
+    assert len(os.listdir(tmp_path / 'universo')) == 2
+
+    requisicoes = fonte.requisicoes
+    matriz, tickers = montar_retornos_universo(*parametros, excluir=())
+    assert len(tickers) == len(universo) - 1 and fonte.requisicoes == requisicoes